@@ -0,0 +1,194 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Check that the scanner engine reads the same rows as the expat engine.
+
+A document with a sheet per fixture is written, each holding cells the
+scanner has to get right or hand over to expat: empty values, formulas,
+inline strings, entities, other attribute orders, ... Every sheet is read
+with both engines in every row mode, with all shared strings loaded and
+with only the ones of the sheet. The exit status is 1 if a row differs.
+"""
+
+import os
+import sys
+import zipfile
+import optparse
+import tempfile
+from benchmarks import generate
+
+SHARED_STRINGS = [u'plain', u'a & b', u'\xe9t\xe9', u'']
+
+# sheet name and the XML of its sheetData rows, style 1 is an integer and
+# style 3 a date number format, see generate.STYLES
+FIXTURES = (
+    ('empty', [
+        '<row r="1"><c r="A1"><v></v></c><c r="B1" s="1"><v></v></c>'
+        '<c r="C1" s="3"><v></v></c><c r="D1" t="s"><v></v></c>'
+        '<c r="E1" t="str"><v></v></c><c r="F1" t="b"><v></v></c></row>',
+        '<row r="2"><c r="A2" s="1"/><c r="C2"></c><c r="D2" t="s"/></row>',
+        '<row r="3"/>',
+        '<row r="5" spans="1:3"></row>',
+        '<row r="6"><c r="B6" s="1"><v>7</v></c></row>',
+    ]),
+    ('formulas', [
+        '<row r="1"><c r="A1" s="1"><f>B1*2</f><v>4</v></c>'
+        '<c r="B1" s="1"><v>2</v></c><c r="C1" t="str"><f>"x"&amp;"y"</f>'
+        '<v>xy</v></c></row>',
+        '<row r="2"><c r="A2" s="1"><f t="shared" ref="A2:A3" si="0">B2*2'
+        '</f><v>6</v></c><c r="B2"><f>1/0</f><v>#DIV/0!</v></c></row>',
+        '<row r="3"><c r="A3" s="1"><f t="shared" si="0"/><v>8</v></c>'
+        '<c r="B3" t="e"><f>NA()</f><v>#N/A</v></c></row>',
+        '<row r="4"><c r="A4"><f>A1</f></c><c r="B4" t="b"><f>TRUE()</f>'
+        '<v>1</v></c></row>',
+    ]),
+    ('inline', [
+        '<row r="1"><c r="A1" t="inlineStr"><is><t>inline</t></is></c>'
+        '<c r="B1" s="1"><v>1</v></c></row>',
+        '<row r="2"><c r="A2" t="inlineStr"><is><r><t>rich</t></r><r><t> '
+        'text</t></r></is></c></row>',
+        '<row r="3"><c r="A3" t="s"><v>0</v></c></row>',
+    ]),
+    ('entities', [
+        '<row r="1"><c r="A1" t="str"><v>a &lt; b &amp;&amp; c &gt; d</v>'
+        '</c><c r="B1" t="str"><v>&quot;q&quot; &apos;a&apos;</v></c>'
+        '</row>',
+        '<row r="2"><c r="A2" t="str"><v>&#233;&#xe9;&#x263A;</v></c>'
+        '<c r="B2" t="s"><v>1</v></c><c r="C2" t="s"><v>2</v></c></row>',
+        '<row r="3"><c r="A3" t="str"><v><![CDATA[<cdata> & more]]></v>'
+        '</c></row>',
+        '<row r="4"><c r="A4" t="str"><v>\xc3\xa9 utf-8</v></c>'
+        '<c r="B4" t="s"><v>3</v></c></row>',
+    ]),
+    ('attributes', [
+        '<row r="1"><c s="1" r="A1"><v>1</v></c><c r="B1" t="s" s="0">'
+        '<v>0</v></c></row>',
+        '<row r="2"><c t="s" r="A2"><v>1</v></c><c r="B2" s="2" '
+        'cm="1"><v>2.5</v></c></row>',
+        '<row r="3"><c r=\'A3\' s=\'1\'><v>3</v></c>'
+        '<c  r="B3"  s="1" ><v>4</v></c></row>',
+        '<row r="4"><c r="A4" s="1">\n  <v>5</v>\n</c>'
+        '<!-- comment --><c r="C4" s="4"><v>40000.5</v></c></row>',
+        '<row r="5" ht="20" customHeight="1"><c r="A5" s="3"><v>40000</v>'
+        '</c></row>',
+        '<row r="6"><c r="A6" t="n" s="3"><v>40000</v></c><c r="B6" cm="1" '
+        's="1"><v>6</v></c><c r="C6" t="s" s="2"><v>0</v></c></row>',
+    ]),
+)
+
+def sheet_xml(rows):
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="%s"><sheetData>%s</sheetData></worksheet>' % (
+                generate.NS, ''.join(rows)))
+
+def workbook_xml(names):
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="%s" xmlns:r="%s"><sheets>%s</sheets>'
+            '</workbook>' % (generate.NS, generate.NS_REL, ''.join(
+                '<sheet name="%s" sheetId="%d" r:id="rId%d"/>' % (
+                    name, i + 1, i + 1)
+                for i, name in enumerate(names))))
+
+def shared_strings_xml():
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="%s" count="%d" uniqueCount="%d">%s</sst>' % (
+                generate.NS, len(SHARED_STRINGS), len(SHARED_STRINGS),
+                ''.join('<si><t>%s</t></si>' % generate.escape(s)
+                        for s in SHARED_STRINGS))).encode('UTF-8')
+
+def write_fixtures(filename):
+    """ Write the document with a sheet per fixture to filename """
+    z = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        z.writestr('[Content_Types].xml', generate.CONTENT_TYPES)
+        z.writestr('xl/workbook.xml',
+                   workbook_xml([name for name, rows in FIXTURES]))
+        z.writestr('xl/styles.xml', generate.styles_xml())
+        z.writestr('xl/sharedStrings.xml', shared_strings_xml())
+        for i, (name, rows) in enumerate(FIXTURES):
+            z.writestr('xl/worksheets/sheet%d.xml' % (i + 1),
+                       sheet_xml(rows))
+    finally:
+        z.close()
+
+def check(filename, row_modes, strings_modes):
+    """
+    Compare the engines on every sheet of the document in the row modes
+    and shared strings modes and return the lines of a report and if all
+    of them agree.
+    """
+    from fastxlsx import reader, scanner
+    lines = []
+    agree = True
+    for strings_mode in strings_modes:
+        for row_mode in row_modes:
+            doc = reader.Document(filename, row_mode=row_mode,
+                                  shared_strings_mode=strings_mode)
+            for name in doc.sheet_names():
+                try:
+                    row = scanner.compare_engines(doc, name, row_mode)
+                except Exception, e:
+                    row = e
+                key = (name, row_mode, strings_mode)
+                if row is None:
+                    lines.append('%-12s %-8s %-8s ok' % key)
+                    continue
+                agree = False
+                if isinstance(row, Exception):
+                    lines.append('%-12s %-8s %-8s FAILED: %r' % (key + (row,)))
+                else:
+                    lines.append('%-12s %-8s %-8s row %d DIFFERS' % (
+                        key + (row + 1,)))
+    return lines, agree
+
+def main():
+    from fastxlsx import reader
+    row_modes = (reader.Sheet.ROW_DICT, reader.Sheet.ROW_VALUES,
+                 reader.Sheet.ROW_CELLS, reader.Sheet.ROW_LAZY)
+    strings_modes = (reader.Document.STRINGS_LIST,
+                     reader.Document.STRINGS_SPARSE)
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--row-modes', default=','.join(row_modes),
+                      help="comma separated row modes (default: %default)")
+    parser.add_option('--strings-modes', default=','.join(strings_modes),
+                      help="comma separated shared strings modes "
+                           "(default: %default)")
+    options, args = parser.parse_args()
+    if args:
+        parser.error("Wrong number of arguments")
+
+    fd, filename = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_fixtures(filename)
+        lines, agree = check(filename, options.row_modes.split(','),
+                             options.strings_modes.split(','))
+    finally:
+        os.unlink(filename)
+    for line in lines:
+        print line
+    if not agree:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Generate synthetic XLSX documents with a single sheet named Data.
+
+The first row holds the column names, the other rows random values. Each
+column gets a kind, drawn from the numbers, strings and dates weights:
+numbers are integer or float columns, dates date or datetime columns and
+strings reference one of strings distinct shared strings. With sparsity
+that part of the cells is left out.
+"""
+
+import os
+import random
+import zipfile
+import optparse
+import tempfile
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_STRING = 'string'
+KIND_DATE = 'date'
+KIND_DATETIME = 'datetime'
+
+# cell style index of the kinds, see STYLES
+KIND_STYLES = {
+    KIND_INT: 1,
+    KIND_FLOAT: 2,
+    KIND_DATE: 3,
+    KIND_DATETIME: 4,
+}
+# serial dates of 1990 to 2029
+DATE_RANGE = (32874, 47484)
+# built in number formats: General, 0, 0.00, m-d-yy and m-d-yy h:mm
+STYLES = (0, 1, 2, 14, 22)
+
+NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+          'relationships')
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '</Types>')
+
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="%s" xmlns:r="%s"><sheets>'
+    '<sheet name="Data" sheetId="1" r:id="rId1"/>'
+    '</sheets></workbook>' % (NS, NS_REL))
+
+def column_name(column):
+    """ Return the letters of the column number (1 is A) """
+    letters = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def column_kinds(rnd, columns, numbers, strings, dates):
+    """ Return a kind per column drawn from the weights """
+    total = float(numbers + strings + dates)
+    if total <= 0:
+        raise ValueError("At least one of the weights must be positive")
+    kinds = []
+    for i in xrange(columns):
+        x = rnd.random() * total
+        if x < numbers:
+            kinds.append(rnd.choice((KIND_INT, KIND_FLOAT)))
+        elif x < numbers + strings:
+            kinds.append(KIND_STRING)
+        else:
+            kinds.append(rnd.choice((KIND_DATE, KIND_DATETIME)))
+    return kinds
+
+def cell_xml(rnd, kind, ref, strings):
+    """ Return the XML of a cell with a random value of the kind """
+    if kind == KIND_STRING:
+        return '<c r="%s" t="s"><v>%d</v></c>' % (ref, rnd.randrange(strings))
+    elif kind == KIND_INT:
+        value = '%d' % rnd.randrange(-100000, 1000000)
+    elif kind == KIND_FLOAT:
+        value = repr(rnd.uniform(-1000.0, 100000.0))
+    elif kind == KIND_DATE:
+        value = '%d' % rnd.randrange(*DATE_RANGE)
+    else:
+        value = repr(rnd.uniform(*DATE_RANGE))
+    return '<c r="%s" s="%d"><v>%s</v></c>' % (ref, KIND_STYLES[kind], value)
+
+def write_sheet(out, rnd, rows, kinds, strings, sparsity):
+    columns = len(kinds)
+    letters = [column_name(c + 1) for c in xrange(columns)]
+    out.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<worksheet xmlns="%s"><dimension ref="A1:%s%d"/>'
+              '<sheetData>' % (NS, letters[-1], rows))
+    # the column names follow the random strings in the shared strings
+    out.write('<row r="1">%s</row>' % ''.join(
+        '<c r="%s1" t="s"><v>%d</v></c>' % (l, strings + c)
+        for c, l in enumerate(letters)))
+    for r in xrange(2, rows + 1):
+        cells = []
+        for c, kind in enumerate(kinds):
+            if sparsity and rnd.random() < sparsity:
+                continue
+            cells.append(cell_xml(rnd, kind, '%s%d' % (letters[c], r),
+                                  strings))
+        out.write('<row r="%d">%s</row>' % (r, ''.join(cells)))
+    out.write('</sheetData></worksheet>')
+
+def shared_strings_xml(rnd, strings, columns):
+    items = [u'%s \xe9 & %d' % (''.join(rnd.choice('abcdefghijklmnop')
+                                        for i in xrange(rnd.randrange(3, 24))),
+                                i)
+             for i in xrange(strings)]
+    items.extend(u'column %d' % (c + 1) for c in xrange(columns))
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="%s" count="%d" uniqueCount="%d">%s</sst>' % (
+                NS, len(items), len(items),
+                ''.join('<si><t>%s</t></si>' % escape(s) for s in items))
+            ).encode('UTF-8')
+
+def styles_xml():
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<styleSheet xmlns="%s"><cellXfs count="%d">%s</cellXfs>'
+            '</styleSheet>' % (NS, len(STYLES), ''.join(
+                '<xf numFmtId="%d" fontId="0" fillId="0" borderId="0" '
+                'xfId="0"/>' % f for f in STYLES)))
+
+def generate(filename, rows=100000, columns=10, numbers=5, strings=3,
+             dates=2, cardinality=1000, sparsity=0.0, seed=1):
+    """
+    Write a XLSX document with a sheet of rows rows (the column names
+    included) and columns columns to filename. The numbers, strings and
+    dates weights decide the mix of the column kinds, cardinality is the
+    number of distinct shared strings and sparsity the part of the cells
+    left empty. The same arguments always produce the same document.
+    """
+    rnd = random.Random(seed)
+    kinds = column_kinds(rnd, columns, numbers, strings, dates)
+    cardinality = max(cardinality, 1)
+    z = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        z.writestr('[Content_Types].xml', CONTENT_TYPES)
+        z.writestr('xl/workbook.xml', WORKBOOK)
+        z.writestr('xl/styles.xml', styles_xml())
+        z.writestr('xl/sharedStrings.xml',
+                   shared_strings_xml(rnd, cardinality, columns))
+        # the sheet may be large, stream it through a temporary file
+        fd, tmpname = tempfile.mkstemp(suffix='.xml')
+        try:
+            out = os.fdopen(fd, 'wb')
+            try:
+                write_sheet(out, rnd, rows, kinds, cardinality, sparsity)
+            finally:
+                out.close()
+            z.write(tmpname, 'xl/worksheets/sheet1.xml')
+        finally:
+            os.unlink(tmpname)
+    finally:
+        z.close()
+    return kinds
+
+def add_options(parser):
+    """ Add the generator options to an optparse parser """
+    parser.add_option('--rows', type='int', default=100000,
+                      help="number of rows (default: 100000)")
+    parser.add_option('--columns', type='int', default=10,
+                      help="number of columns (default: 10)")
+    parser.add_option('--numbers', type='float', default=5,
+                      help="weight of number columns (default: 5)")
+    parser.add_option('--strings', type='float', default=3,
+                      help="weight of shared string columns (default: 3)")
+    parser.add_option('--dates', type='float', default=2,
+                      help="weight of date columns (default: 2)")
+    parser.add_option('--cardinality', type='int', default=1000,
+                      help="number of distinct shared strings "
+                           "(default: 1000)")
+    parser.add_option('--sparsity', type='float', default=0.0,
+                      help="part of the cells left empty, 0.0 to 1.0 "
+                           "(default: 0.0)")
+    parser.add_option('--seed', type='int', default=1,
+                      help="seed of the random values (default: 1)")
+
+def options_params(options):
+    """ Return the generate() keyword arguments of the parsed options """
+    return dict(rows=options.rows, columns=options.columns,
+                numbers=options.numbers, strings=options.strings,
+                dates=options.dates, cardinality=options.cardinality,
+                sparsity=options.sparsity, seed=options.seed)
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <FILENAME>.xlsx")
+    add_options(parser)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Wrong number of arguments")
+    kinds = generate(args[0], **options_params(options))
+    print "Wrote %s with %d rows, column kinds: %s" % (
+        args[0], options.rows, ', '.join(kinds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Measure the reader on generated documents and compare with a baseline.
+
+Every scenario is run in its own process, so the peak RSS of one doesn't
+hide the one of the next. A scenario reads the sheet with Document.sheet()
+and a row event handler:
+
+  noop    a handler doing nothing
+  firstn  a FirstNRowStorage keeping the first rows
+  csv     a csvconverter.Converter writing a temporary CSV file
+  fastcsv a csvconverter.FastConverter writing a temporary CSV file
+  rawcsv  the same, with the numbers kept as stored in the sheet
+
+The results are written as JSON. Given a baseline file of an earlier run,
+the rows/s and peak RSS of each scenario and engine are compared and the
+exit status is 1 if one got worse by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import optparse
+import subprocess
+from benchmarks import generate
+
+SCENARIOS = ('noop', 'firstn', 'csv', 'fastcsv', 'rawcsv')
+ENGINES = ('expat', 'scanner')
+TOLERANCE = 0.1
+
+def run_scenario(filename, scenario, engine, row_mode=None):
+    """
+    Read the sheet of the document with the handler of the scenario and
+    return the result, with the peak RSS of this process.
+    """
+    from fastxlsx import reader, csvconverter
+    if row_mode is None:
+        row_mode = reader.Sheet.ROW_DICT
+    outname = None
+    raw_numbers = False
+    if scenario == 'noop':
+        handler = lambda row: None
+    elif scenario == 'firstn':
+        handler = reader.FirstNRowStorage(10)
+    elif scenario == 'csv':
+        fd, outname = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        handler = csvconverter.Converter(outname)
+        row_mode = handler.ROW_MODE
+    elif scenario in ('fastcsv', 'rawcsv'):
+        fd, outname = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        handler = csvconverter.FastConverter(outname)
+        row_mode = handler.ROW_MODE
+        raw_numbers = scenario == 'rawcsv'
+    else:
+        raise ValueError("Unknown scenario: %s" % scenario)
+
+    start = time.time()
+    doc = reader.Document(filename, row_mode=row_mode, engine=engine,
+                          raw_numbers=raw_numbers)
+    rows = [0]
+    def count(row):
+        rows[0] += 1
+    doc.add_row_event_handler(count)
+    doc.add_row_event_handler(handler)
+    try:
+        doc.sheet(doc.sheet_names()[0])
+    finally:
+        if outname is not None:
+            handler.close()
+            os.unlink(outname)
+    seconds = time.time() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024   # bytes instead of KB
+    return {
+        'scenario': scenario,
+        'engine': engine,
+        'row_mode': row_mode,
+        'rows': rows[0],
+        'seconds': seconds,
+        'rows_per_second': rows[0] / seconds if seconds else 0.0,
+        'peak_rss_kb': peak_rss,
+    }
+
+def run_in_process(filename, scenario, engine):
+    """ Run the scenario in a new python process and return the result """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + filter(None, [env.get('PYTHONPATH')]))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.run', '--worker',
+         '--engines', engine, '--scenarios', scenario, filename],
+        stdout=subprocess.PIPE, env=env)
+    output, _ = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError("Scenario %s with %s failed" % (scenario, engine))
+    return json.loads(output)
+
+def best_of(results):
+    """ Return the fastest of the results of repeated runs, max peak RSS """
+    best = dict(max(results, key=lambda r: r['rows_per_second']))
+    best['peak_rss_kb'] = max(r['peak_rss_kb'] for r in results)
+    best['runs'] = len(results)
+    return best
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare the results with the ones of the baseline run and return the
+    lines of a report and if one of them regressed by more than tolerance.
+    """
+    previous = dict(((r['scenario'], r['engine']), r)
+                    for r in baseline['results'])
+    lines = []
+    regressed = False
+    for r in results:
+        key = (r['scenario'], r['engine'])
+        if key not in previous:
+            lines.append('%-8s %-8s not in baseline' % key)
+            continue
+        b = previous[key]
+        speed = r['rows_per_second'] / b['rows_per_second']
+        memory = float(r['peak_rss_kb']) / b['peak_rss_kb']
+        worse = speed < 1 - tolerance or memory > 1 + tolerance
+        regressed = regressed or worse
+        lines.append('%-8s %-8s rows/s %6.2fx  peak RSS %6.2fx%s' % (
+            key + (speed, memory, '  REGRESSION' if worse else '')))
+    return lines, regressed
+
+def document_filename(work_dir, params):
+    """ Return the name of the generated document for the parameters """
+    name = '-'.join('%s%s' % (k, params[k]) for k in sorted(params))
+    return os.path.join(work_dir, 'bench-%s.xlsx' % name)
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]\n"
+                                         "       %prog --worker <FILE>.xlsx")
+    generate.add_options(parser)
+    parser.add_option('--scenarios', default=','.join(SCENARIOS),
+                      help="comma separated scenarios to run "
+                           "(default: %default)")
+    parser.add_option('--engines', default=','.join(ENGINES),
+                      help="comma separated sheet engines (default: "
+                           "%default)")
+    parser.add_option('-n', '--repeat', type='int', default=3,
+                      help="runs per scenario, the best one counts "
+                           "(default: %default)")
+    parser.add_option('-o', '--output', default=None,
+                      help="write the results as JSON to this file")
+    parser.add_option('-b', '--baseline', default=None,
+                      help="compare with the JSON results of an earlier run")
+    parser.add_option('--tolerance', type='float', default=TOLERANCE,
+                      help="allowed slow down or memory growth "
+                           "(default: %default)")
+    parser.add_option('--work-dir', default=tempfile.gettempdir(),
+                      help="directory of the generated documents, they are "
+                           "reused by later runs (default: %default)")
+    parser.add_option('--worker', action='store_true', default=False,
+                      help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    scenarios = options.scenarios.split(',')
+    engines = options.engines.split(',')
+
+    if options.worker:
+        # the output of the handlers must not mix with the result
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_scenario(args[0], scenarios[0], engines[0])
+        json.dump(result, stdout)
+        return
+
+    params = generate.options_params(options)
+    filename = document_filename(options.work_dir, params)
+    if not os.path.exists(filename):
+        print >>sys.stderr, "Generating %s ..." % filename
+        generate.generate(filename, **params)
+
+    results = []
+    for scenario in scenarios:
+        for engine in engines:
+            result = best_of([run_in_process(filename, scenario, engine)
+                              for i in xrange(options.repeat)])
+            results.append(result)
+            print "%-8s %-8s %8d rows %10.0f rows/s %8d KB peak RSS" % (
+                scenario, engine, result['rows'], result['rows_per_second'],
+                result['peak_rss_kb'])
+
+    import fastxlsx
+    report = {
+        'version': fastxlsx.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': params,
+        'file_size': os.path.getsize(filename),
+        'results': results,
+    }
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(report, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+    if options.baseline:
+        f = open(options.baseline)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        if baseline['params'] != params:
+            print "Warning: the baseline used other document parameters"
+        lines, regressed = compare(results, baseline, options.tolerance)
+        print "Compared with %s:" % options.baseline
+        for line in lines:
+            print "    " + line
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -23,47 +23,103 @@
 import sys
 import csv
 import datetime
+import optparse
 import fastxlsx
 
+parser = optparse.OptionParser(
+    usage="%prog [options] <FILENAME>.xslx <SHEETNAME>\n"
+          "       %prog [options] --all <FILENAME>.xslx")
+parser.add_option('-a', '--all', action='store_true', default=False,
+                  help="convert all sheets, each into its own CSV file")
+parser.add_option('-j', '--jobs', type='int', default=None,
+                  help="number of worker processes, with --all the "
+                       "default is the number of CPUs, otherwise a single "
+                       "sheet is parsed in parallel if given")
+parser.add_option('-c', '--columns', default=None,
+                  help="comma separated list of the columns to read, by "
+                       "letters, number (1 is A) or header name")
+parser.add_option('-r', '--raw-numbers', action='store_true', default=False,
+                  help="write numbers as stored in the sheet, without "
+                       "converting them by their number format")
+parser.add_option('-z', '--compress', default=None,
+                  choices=fastxlsx.csvconverter.COMPRESSIONS,
+                  help="compress the CSV output with gzip, bz2 or lzma")
+parser.add_option('-w', '--write-thread', action='store_true', default=False,
+                  help="write (and compress) the CSV output in a background "
+                       "thread, overlapping with parsing")
+
 def usage(msg):
     if msg:
         print msg
-    print "Usage: xslx-to-csv.py <FILENAME>.xslx <SHEETNAME>\n"
+    parser.print_usage()
     sys.exit(1)
 
-if len(sys.argv) < 3:
+options, args = parser.parse_args()
+if len(args) < (1 if options.all else 2):
     usage('Wrong number of arguments')
 
-filename = sys.argv[1]
+filename = args[0]
 if not filename:
     usage("No filename specified")
-sheetname = sys.argv[2]
+columns = None
+if options.columns:
+    columns = [int(c) if c.isdigit() else c.decode('UTF-8')
+               for c in options.columns.split(',')]
+
+if (options.compress == fastxlsx.csvconverter.COMPRESSION_LZMA and
+        fastxlsx.csvconverter.lzma is None):
+    usage("lzma compression needs the lzma module")
+
+if options.all:
+    print "Fast XLSX reader"
+    doc = fastxlsx.reader.Document(filename,
+                                   raw_numbers=options.raw_numbers)
+    print "Loading shared parts of workbook..."
+    fastxlsx.parallel.load_shared_parts(doc)
+    print "    - Workbook contains sheets:", doc.sheet_names()
+    for name, outname, rows, width in fastxlsx.parallel.convert_sheets(
+            doc, processes=options.jobs, compression=options.compress,
+            background=options.write_thread, columns=columns):
+        print "    - sheet %s: %d rows with %d columns written to %s" % (
+            name, rows, width, outname)
+    print "Done converting document"
+    sys.exit(0)
+
+sheetname = args[1]
 if not sheetname:
     usage("No sheetname specified")
 
 print "Fast XLSX reader"
 
-outfile = file("%s-%s.csv" % (filename, sheetname), 'w')
-
+outfile = fastxlsx.parallel.csv_filename(filename, sheetname,
+                                         options.compress)
 print ''
 
-doc = fastxlsx.reader.Document()
+doc = fastxlsx.reader.Document(
+    row_mode=fastxlsx.csvconverter.FastConverter.ROW_MODE,
+    raw_numbers=options.raw_numbers)
 print "Loading workbook in progress..."
 print "    - create CSV converter"
-handler = fastxlsx.csvconverter.Converter(outfile, with_progress=True)
+handler = fastxlsx.csvconverter.FastConverter(
+    outfile, compression=options.compress, background=options.write_thread)
 print "    - open input file %s ..." % filename
 doc.add_row_event_handler(handler)
-doc.open(sys.argv[1])
+doc.set_progress_handler(fastxlsx.reader.print_progress)
+doc.open(filename)
 print "    - shared strings...",
 count = len(doc.shared_strings())
 print " Loaded %d shared strings" % count
 print "    - Workbook contains sheets:", doc.sheet_names()
 print "    - select work sheet %s" % sheetname
-sheet = doc.sheet(sheetname)
-if not sheet:
-    print "No such sheet found:", sheetname
-    sys.exit(1)
+if options.jobs:
+    fastxlsx.parallel.parse_sheet(doc, sheetname, options.jobs,
+                                  columns=columns)
+else:
+    sheet = doc.sheet(sheetname, columns)
+    if not sheet:
+        print "No such sheet found:", sheetname
+        sys.exit(1)
 
 print "\nRead %d rows with %d columns" % (handler.rows, handler.columns)
 print "Done converting document"
-outfile.close()
+handler.close()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import sys
+import optparse
+import fastxlsx
+
+Loader = fastxlsx.sqliteloader.Loader
+
+parser = optparse.OptionParser(
+    usage="%prog [options] <FILENAME>.xslx <SHEETNAME> <DATABASE>")
+parser.add_option('-t', '--table', default=None,
+                  help="name of the table (default: the sheet name)")
+parser.add_option('--if-exists', default=Loader.IF_EXISTS_FAIL,
+                  choices=(Loader.IF_EXISTS_FAIL, Loader.IF_EXISTS_REPLACE,
+                           Loader.IF_EXISTS_APPEND),
+                  help="what to do if the table exists: fail, replace or "
+                       "append (default: fail)")
+parser.add_option('-b', '--batch-size', type='int', default=10000,
+                  help="rows per executemany call (default: 10000)")
+parser.add_option('--transaction-size', type='int', default=1000000,
+                  help="rows per transaction (default: 1000000)")
+parser.add_option('-p', '--pragma', action='append', default=[],
+                  metavar='NAME=VALUE',
+                  help="set a SQLite PRAGMA, overrides the bulk load "
+                       "defaults (may be repeated)")
+parser.add_option('-c', '--columns', default=None,
+                  help="comma separated list of the columns to read, by "
+                       "letters, number (1 is A) or header name")
+
+def usage(msg):
+    if msg:
+        print msg
+    parser.print_usage()
+    sys.exit(1)
+
+options, args = parser.parse_args()
+if len(args) < 3:
+    usage('Wrong number of arguments')
+filename, sheetname, database = args[:3]
+columns = None
+if options.columns:
+    columns = [int(c) if c.isdigit() else c.decode('UTF-8')
+               for c in options.columns.split(',')]
+
+pragmas = dict(Loader.PRAGMAS)
+for pragma in options.pragma:
+    if '=' not in pragma:
+        usage("Invalid pragma: %s" % pragma)
+    name, value = pragma.split('=', 1)
+    pragmas[name.strip()] = value.strip()
+
+print "Fast XLSX reader"
+print ''
+
+doc = fastxlsx.reader.Document(filename, row_mode=Loader.ROW_MODE)
+doc.set_progress_handler(fastxlsx.reader.print_progress)
+print "Loading workbook in progress..."
+print "    - Workbook contains sheets:", doc.sheet_names()
+print "    - load work sheet %s into table %s of %s" % (
+    sheetname, options.table or sheetname, database)
+loader = Loader(database, options.table or sheetname,
+                if_exists=options.if_exists,
+                batch_size=options.batch_size,
+                transaction_size=options.transaction_size,
+                pragmas=pragmas.items())
+try:
+    for row in doc.iter_rows(sheetname, columns=columns):
+        loader(row)
+finally:
+    loader.close()
+
+print "\nLoaded %d rows with %d columns" % (loader.rows, loader.columns)
+print "Done loading document"
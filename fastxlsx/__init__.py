@@ -27,6 +27,10 @@ keep memory footprint low.
 
 from fastxlsx import reader
 from fastxlsx import csvconverter
+from fastxlsx import sqliteloader
+from fastxlsx import parallel
+from fastxlsx import scanner
+from fastxlsx import columnar
 
 __major__ = 0  # for major interface/format changes
 __minor__ = 2  # for minor interface/format changes
@@ -41,4 +45,5 @@ __maintainer_email__ = 'andy@knitter.ch'
 __url__ = 'http://github.com/AndyStricker/FastXLSX'
 __downloadUrl__ = "http://github.com/AndyStricker/FastXSLX/downloads"
 
-__all__ = ('reader', 'csvconverter',)
+__all__ = ('reader', 'csvconverter', 'sqliteloader', 'parallel',
+           'scanner', 'columnar',)
@@ -0,0 +1,283 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Read sheets in batches of rows stored column by column in NumPy arrays,
+ready to build a pandas DataFrame from.
+
+The type of a column is decided from the number formats of its cells:
+int64 for integer formats, float64 for the other numeric formats,
+datetime64 for date and datetime formats, timedelta64 for durations and
+object arrays for text and anything mixed. Each array comes with a mask
+that is True for empty cells.
+
+Dates are read as serial numbers and converted a whole column at once,
+see serials_to_datetime64().
+"""
+
+import datetime
+import collections
+from fastxlsx import reader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_DATE = 'date'
+KIND_DATETIME = 'datetime'
+KIND_TIMEDELTA = 'timedelta'
+KIND_OBJECT = 'object'
+
+STYLE_KINDS = {
+    int: KIND_INT,
+    float: KIND_FLOAT,
+    datetime.date: KIND_DATE,
+    datetime.datetime: KIND_DATETIME,
+    datetime.timedelta: KIND_TIMEDELTA,
+}
+
+# kind of a column with cells of two different kinds
+MERGED_KINDS = {
+    frozenset((KIND_INT, KIND_FLOAT)): KIND_FLOAT,
+    frozenset((KIND_DATE, KIND_DATETIME)): KIND_DATETIME,
+}
+
+# python types a value of the kind must have, dates are serial numbers
+KIND_TYPES = {
+    KIND_INT: (int, long),
+    KIND_FLOAT: (int, long, float),
+    KIND_DATE: (float,),
+    KIND_DATETIME: (float,),
+    KIND_TIMEDELTA: (datetime.timedelta,),
+}
+
+DTYPES = {
+    KIND_INT: 'int64',
+    KIND_FLOAT: 'float64',
+    KIND_DATE: 'datetime64[D]',
+    KIND_DATETIME: 'datetime64[us]',
+    KIND_TIMEDELTA: 'timedelta64[us]',
+    KIND_OBJECT: object,
+}
+
+# value stored for empty cells
+NULLS = {
+    KIND_INT: 0,
+    KIND_FLOAT: float('nan'),
+    KIND_DATE: float('nan'),
+    KIND_DATETIME: float('nan'),
+}
+
+# serial number of 1970-01-01 by datemode
+EPOCH_SERIALS = (25569, 24107)
+# first valid day number and first too large one by datemode, see xldate
+VALID_DAYS = ((61, 2958466), (1, 2958466 - 1462))
+
+class Batch(object):
+    """
+    Rows of a sheet stored column by column. For each of the column names
+    there is an array with the values, a mask marking the empty cells and
+    the kind of the column.
+    """
+    def __init__(self, names, arrays, masks, kinds):
+        self.names = names
+        self.arrays = arrays
+        self.masks = masks
+        self.kinds = kinds
+
+    def __len__(self):
+        if not self.arrays:
+            return 0
+        return len(self.arrays[0])
+
+    def as_dict(self):
+        """ Return an ordered dict of the arrays by column name """
+        return collections.OrderedDict(zip(self.names, self.arrays))
+
+def column_name(column):
+    """ Return the letters of the column number (1 is A) """
+    letters = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def iter_batches(doc, name, batch_size=10000, header=True, columns=None):
+    """
+    Yield the rows of the sheet with the name in batches of batch_size
+    rows. With header the first row provides the column names and is not
+    part of a batch, otherwise the columns are named by their letters.
+    With columns only the selected columns are read.
+    """
+    if numpy is None:
+        raise ImportError("iter_batches needs NumPy")
+    styles = doc.styles()
+    kinds = dict((unicode(i), STYLE_KINDS.get(t, KIND_OBJECT))
+                 for i, t in enumerate(styles.cell_types))
+    kinds[None] = kinds[u'0']
+    date_types = (datetime.datetime, datetime.date, datetime.time)
+    dates = dict((unicode(i), c) for i, (c, t) in enumerate(
+        zip(styles.converters, styles.cell_types)) if t in date_types)
+    if u'0' in dates:
+        dates[None] = dates[u'0']
+    datemode = doc.workbook().datemode
+
+    names = []
+    if columns is not None:
+        columns = doc.select_columns(name, columns)
+        names = [column_name(c) for c in columns]
+    sheet = doc.create_sheet(doc.workbook().sheet_id(name),
+                             reader.Sheet.ROW_CELLS, columns)
+    sheet.raw_dates = True
+    rows = sheet.iter_rows()
+    if header:
+        for row in rows:
+            names = [unicode(cell_object(cell, dates)) for cell in row]
+            break
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield make_batch(batch, names, kinds, dates, datemode)
+            batch = []
+    if batch:
+        yield make_batch(batch, names, kinds, dates, datemode)
+
+def cell_object(cell, dates):
+    """ Return the python value of the cell, dates are still serials """
+    value = cell.value
+    if cell.style_idx in dates and isinstance(value, float):
+        return dates[cell.style_idx](repr(value))
+    return value
+
+def make_batch(rows, names, kinds, dates, datemode=0):
+    """
+    Store the rows of cells column by column. The dates maps the style
+    indices of date styles to their converter.
+    """
+    width = max(len(names), max(len(row) for row in rows))
+    columns = [[] for i in xrange(width)]
+    for row in rows:
+        for column, cell in zip(columns, row):
+            column.append(cell)
+        for column in columns[len(row):]:
+            column.append(None)
+
+    names = list(names) + [column_name(i + 1)
+                           for i in xrange(len(names), width)]
+    arrays = []
+    masks = []
+    column_kinds = []
+    for cells in columns:
+        mask = numpy.fromiter((cell is None or cell.value == ''
+                               for cell in cells), bool, len(cells))
+        kind = column_kind(cells, kinds)
+        array = None
+        if kind != KIND_OBJECT:
+            values = [None if cell is None or cell.value == ''
+                      else cell.value for cell in cells]
+            try:
+                array = make_array(values, kind, datemode)
+            except (OverflowError, ValueError, TypeError):
+                kind = KIND_OBJECT
+        if array is None:
+            values = [None if cell is None or cell.value == ''
+                      else cell_object(cell, dates) for cell in cells]
+            array = make_array(values, kind)
+        arrays.append(array)
+        masks.append(mask)
+        column_kinds.append(kind)
+    return Batch(names, arrays, masks, column_kinds)
+
+def column_kind(cells, kinds):
+    """ Return the kind of the column from the number formats of its cells """
+    kind = None
+    for cell in cells:
+        if cell is None or cell.value == '':
+            continue
+        cell_kind = kinds.get(cell.style_idx, KIND_OBJECT)
+        if cell_kind != kind:
+            if kind is None:
+                kind = cell_kind
+            else:
+                kind = MERGED_KINDS.get(frozenset((kind, cell_kind)),
+                                        KIND_OBJECT)
+            if kind == KIND_OBJECT:
+                return kind
+        # the number format doesn't fit values like shared strings
+        value = cell.value
+        if isinstance(value, bool) or not isinstance(value, KIND_TYPES[kind]):
+            return KIND_OBJECT
+    if kind is None:
+        return KIND_OBJECT
+    return kind
+
+def make_array(values, kind, datemode=0):
+    """
+    Return the array of the kind with the values, None for empty cells.
+    Dates are given as serial numbers of the datemode.
+    """
+    if kind in NULLS:
+        null = NULLS[kind]
+        values = [null if v is None else v for v in values]
+    elif kind == KIND_OBJECT:
+        array = numpy.empty(len(values), object)
+        array[:] = values
+        return array
+    if kind in (KIND_DATE, KIND_DATETIME):
+        return serials_to_datetime64(values, kind, datemode)
+    return numpy.array(values, DTYPES[kind])
+
+def serials_to_datetime64(serials, kind=KIND_DATETIME, datemode=0):
+    """
+    Convert Excel serial dates of the datemode to a datetime64 array of the
+    kind (KIND_DATE or KIND_DATETIME) in one go, rounded to seconds like
+    reader.DateConverter. NaN serials become NaT. Raise ValueError if a
+    serial is no valid date.
+    """
+    serials = numpy.asarray(serials, 'float64')
+    valid = ~numpy.isnan(serials)
+    serials = numpy.where(valid, serials, 0.0)
+    days = numpy.floor(serials)
+    seconds = (serials - days) * 86400.0
+    whole = numpy.floor(seconds)
+    # round half up like round() in DateConverter.split()
+    seconds = whole + (seconds - whole >= 0.5)
+    days += seconds == 86400.0
+    seconds[seconds == 86400.0] = 0.0
+
+    first, too_large = VALID_DAYS[datemode]
+    checked = days[valid]
+    if len(checked) and (checked.min() < first or checked.max() >= too_large):
+        raise ValueError("Invalid serial date in column")
+    days = (days - EPOCH_SERIALS[datemode]).astype('int64')
+    if kind == KIND_DATE:
+        array = days.astype(DTYPES[KIND_DATE])
+    else:
+        micros = days * 86400000000 + seconds.astype('int64') * 1000000
+        array = micros.astype(DTYPES[KIND_DATETIME])
+    array[~valid] = numpy.datetime64('NaT')
+    return array
@@ -20,48 +20,135 @@
 # SOFTWARE.
 #
 
-import sys
 import csv
+import sys
+import gzip
+import bz2
+import Queue
 import datetime
+import functools
+import itertools
+import threading
+import cStringIO
 import fastxlsx
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_BZ2 = 'bz2'
+COMPRESSION_LZMA = 'lzma'
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_BZ2, COMPRESSION_LZMA)
+# file name suffix by compression
+SUFFIXES = {
+    None: '',
+    COMPRESSION_GZIP: '.gz',
+    COMPRESSION_BZ2: '.bz2',
+    COMPRESSION_LZMA: '.xz',
+}
+
+def open_output(filename, compression=None, buffer_size=-1):
+    """
+    Open the file for writing, compressed with one of COMPRESSIONS if
+    given. The buffer_size applies to uncompressed files.
+    """
+    if compression is None:
+        return file(filename, 'wb', buffer_size)
+    elif compression == COMPRESSION_GZIP:
+        return gzip.open(filename, 'wb')
+    elif compression == COMPRESSION_BZ2:
+        return bz2.BZ2File(filename, 'w')
+    elif compression == COMPRESSION_LZMA:
+        if lzma is None:
+            raise ImportError("lzma compression needs the lzma module")
+        return lzma.LZMAFile(filename, 'w')
+    raise ValueError("Unknown compression: %r" % (compression,))
+
+class BackgroundWriter(object):
+    """
+    File like writer handing the written data to a background thread
+    through a bounded queue, the thread writes it to the wrapped file
+    handle. Compression and file I/O release the GIL, so they overlap
+    with parsing in the main thread.
+    """
+    QUEUE_DEPTH = 8
+
+    def __init__(self, fh, queue_depth=QUEUE_DEPTH):
+        self.fh = fh
+        self.queue = Queue.Queue(queue_depth)
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._write_behind)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write_behind(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self.fh.write(data)
+        except Exception, e:
+            self.error = e
+            self.stopped.set()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+        raise self.error
+
+    def write(self, data):
+        if data:
+            self._put(data)
+
+    def close(self):
+        """ Wait for the pending data to be written and close the file """
+        try:
+            if self.thread.is_alive():
+                self._put(None)
+                self.thread.join()
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.fh.close()
+
 class Converter(object):
-    """ Convert XSLX to CSV. (with progress status display) """
-    VALUE = fastxlsx.reader.Sheet.VALUE
+    """
+    Convert XSLX to CSV.
+    The rows are expected as value tuples, so open the document in ROW_MODE.
+    """
+    ROW_MODE = fastxlsx.reader.Sheet.ROW_VALUES
 
-    def __init__(self, outfile, with_progress=False):
-        if isinstance(outfile, str):
+    def __init__(self, outfile, with_progress=False, document=None):
+        """
+        With with_progress the progress is printed: by the progress handler
+        of the document if given, see Document.set_progress_handler(),
+        otherwise as the count of the converted rows.
+        """
+        if isinstance(outfile, basestring):
             self.outfile = file(outfile, 'w')
         else:
             self.outfile = outfile
-        self.writer = csv.writer(self.outfile,
-                                 delimiter=',',
-                                 quotechar='"',
-                                 quoting=csv.QUOTE_NONNUMERIC)
-        self.with_progress = with_progress
+        self.writer = self.csv_writer(self.outfile)
+        self.with_progress = with_progress and document is None
+        if with_progress and document is not None:
+            document.set_progress_handler(fastxlsx.reader.print_progress)
         self.first_row = None
         self.columns = 0
         self.rows = 0
 
     def __call__(self, row):
-        record = []
-        for cell in row:
-            v = cell[self.VALUE]
-            if v is None:
-                record.append('')
-            elif isinstance(v, (unicode, str)):
-                record.append(v.encode('UTF-8'))
-            elif isinstance(v, (float, int)):
-                record.append(str(v))
-            elif isinstance(v, datetime.datetime):
-                record.append(v.strftime('%Y-%m-%dT%H:%M:%S'))
-            elif isinstance(v, datetime.date):
-                record.append(v.strftime('%Y-%m-%d'))
-            elif isinstance(v, datetime.time):
-                record.append(v.strftime('%H:%M:%S'))
-            else:
-                raise Exception("Unknown format detected: " + repr(v))
-
+        record = [self.format_value(v) for v in row]
         if self.first_row is None:
             self.columns = len(record)
             self.first_row = record
@@ -74,14 +161,166 @@ class Converter(object):
         if self.with_progress:
             self.update_progress()
 
-    def close(self):
-        if self.outfile:
-            self.outfile.close()
-            self.outfile = None
-
     def update_progress(self):
         r = self.rows
         if (r % 64) == 0:
             print "\rRow %d       " % r,
             sys.stdout.flush()
 
+    @staticmethod
+    def csv_writer(fh):
+        return csv.writer(fh,
+                          delimiter=',',
+                          quotechar='"',
+                          quoting=csv.QUOTE_NONNUMERIC)
+
+    @staticmethod
+    def format_value(v):
+        """ Return the CSV text of a cell value """
+        if v is None:
+            return ''
+        elif isinstance(v, (unicode, str)):
+            return v.encode('UTF-8')
+        elif isinstance(v, (float, int)):
+            return str(v)
+        elif isinstance(v, datetime.datetime):
+            return v.strftime('%Y-%m-%dT%H:%M:%S')
+        elif isinstance(v, datetime.date):
+            return v.strftime('%Y-%m-%d')
+        elif isinstance(v, datetime.time):
+            return v.strftime('%H:%M:%S')
+        elif isinstance(v, datetime.timedelta):
+            return str(v)
+        raise Exception("Unknown format detected: " + repr(v))
+
+    def close(self):
+        if self.outfile:
+            self.outfile.close()
+            self.outfile = None
+
+def _exact_type(kind, format):
+    """ Return format, raising TypeError for values not exactly of kind """
+    def format_exact(v):
+        if v.__class__ is not kind:
+            raise TypeError("Expected %s value" % kind.__name__)
+        return format(v)
+    return format_exact
+
+class FastConverter(Converter):
+    """
+    Convert XLSX to CSV like Converter, but faster.
+    A formatter is compiled per column from the types of the values of the
+    first row after the header. A column whose formatter doesn't fit a
+    later value falls back to looking up the formatter by the type of each
+    value. Records are encoded with writerows() in batches of batch_size
+    rows and each batch is written at once, through an output buffer of
+    buffer_size bytes.
+
+    An output filename is compressed with one of COMPRESSIONS if given.
+    With background the batches are written (and compressed) by a
+    BackgroundWriter thread, holding at most queue_depth pending batches.
+
+    Open the document with raw_numbers to write the numbers as they are
+    stored in the sheet, without converting them to float and back.
+    """
+    BATCH_SIZE = 1000
+    BUFFER_SIZE = 1024 * 1024
+
+    # formatters by value type, raising TypeError for other types
+    FORMATTERS = {
+        type(None): lambda v: '',
+        unicode: functools.partial(unicode.encode, encoding='UTF-8'),
+        str: str.__str__,
+        float: float.__str__,
+        int: int.__str__,
+        long: long.__str__,
+        datetime.datetime: _exact_type(datetime.datetime,
+                                       datetime.datetime.isoformat),
+        datetime.date: _exact_type(datetime.date, datetime.date.isoformat),
+        datetime.time: _exact_type(datetime.time,
+                                   lambda v: v.strftime('%H:%M:%S')),
+        datetime.timedelta: _exact_type(datetime.timedelta,
+                                        datetime.timedelta.__str__),
+    }
+
+    def __init__(self, outfile, batch_size=BATCH_SIZE,
+                 buffer_size=BUFFER_SIZE, compression=None, background=False,
+                 queue_depth=BackgroundWriter.QUEUE_DEPTH):
+        if isinstance(outfile, basestring):
+            outfile = open_output(outfile, compression, buffer_size)
+        if background:
+            outfile = BackgroundWriter(outfile, queue_depth)
+        Converter.__init__(self, outfile)
+        # the records of a batch are encoded into the buffer
+        self.buffer = cStringIO.StringIO()
+        self.writer = self.csv_writer(self.buffer)
+        self.batch_size = batch_size
+        self.batch = []
+        self.formatters = None
+        self.padding = []
+
+    def __call__(self, row):
+        if self.first_row is None:
+            Converter.__call__(self, row)
+            self.padding = [''] * self.columns
+            return
+        formatters = self.formatters
+        if formatters is None or len(row) > len(formatters):
+            record = self.format_row(row)
+        else:
+            try:
+                record = [f(v) for f, v in itertools.izip(formatters, row)]
+            except (TypeError, KeyError):
+                record = self.format_row(row)
+        if len(record) < self.columns:
+            record.extend(self.padding[len(record):])
+        self.batch.append(record)
+        self.rows += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def lookup_value(self, v):
+        """ Format the value with the formatter of its type """
+        return self.FORMATTERS[v.__class__](v)
+
+    def format_row(self, row):
+        """
+        Format the row cell by cell. Compile the formatters of the columns
+        from the row if there are none yet, and fall back to lookup_value()
+        for columns whose formatter doesn't fit the value.
+        """
+        if self.formatters is None:
+            self.formatters = [self.FORMATTERS.get(v.__class__,
+                                                   self.lookup_value)
+                               if v != u'' else self.lookup_value
+                               for v in row]
+        formatters = self.formatters
+        lookup = self.lookup_value
+        while len(formatters) < len(row):
+            formatters.append(lookup)
+        record = []
+        for i, v in enumerate(row):
+            try:
+                record.append(formatters[i](v))
+            except (TypeError, KeyError):
+                formatters[i] = lookup
+                record.append(self.format_value(v))
+        return record
+
+    def flush(self):
+        """ Write the pending records """
+        if self.batch:
+            self.writer.writerows(self.batch)
+            self.batch = []
+        data = self.buffer.getvalue()
+        if data:
+            self.outfile.write(data)
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+    def close(self):
+        try:
+            if self.outfile:
+                self.flush()
+        finally:
+            Converter.close(self)
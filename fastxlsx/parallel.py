@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Process the sheets of a document with a pool of worker processes.
+
+The shared strings, styles and workbook are loaded once in the parent
+process before the pool is started. On platforms that fork, the workers
+inherit them and only open their own handle to the document archive.
+
+Whole sheets can be handed to the workers with convert_sheets(), or a
+single sheet is cut at row boundaries and the pieces are parsed in
+parallel with iter_rows().
+"""
+
+import time
+import collections
+import multiprocessing
+from fastxlsx import reader
+from fastxlsx import csvconverter
+
+# the document of the worker process, inherited from the parent on fork
+_document = None
+# the shared strings of the sheet parsed by iter_rows()
+_shared_strings = None
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+def _init_worker(filename, shared_strings_mode, cache_dir, raw_numbers):
+    global _document
+    if _document is None:
+        _document = reader.Document(filename,
+                                    shared_strings_mode=shared_strings_mode,
+                                    cache_dir=cache_dir,
+                                    raw_numbers=raw_numbers)
+    else:
+        # don't share the zip file handle with the parent process
+        _document.open(filename)
+
+def _convert_sheet(args):
+    sheetname, outfilename, compression, background, columns = args
+    converter = csvconverter.FastConverter(outfilename,
+                                           compression=compression,
+                                           background=background)
+    try:
+        for row in _document.iter_rows(sheetname, converter.ROW_MODE,
+                                       columns):
+            converter(row)
+    finally:
+        converter.close()
+    return sheetname, outfilename, converter.rows, converter.columns
+
+def csv_filename(filename, sheetname, compression=None):
+    """ Return the name of the CSV file for a sheet of the document """
+    return "%s-%s.csv%s" % (filename, sheetname,
+                            csvconverter.SUFFIXES[compression])
+
+def load_shared_parts(doc):
+    """ Load the parts used by all sheets of the document """
+    doc.workbook()
+    doc.styles()
+    if doc.shared_strings_mode != doc.STRINGS_SPARSE:
+        doc.shared_strings()
+
+def convert_sheets(doc, sheetnames=None, processes=None, compression=None,
+                   background=False, columns=None):
+    """
+    Convert the sheets of the document (all by default) into a CSV file
+    each, compressed with one of csvconverter.COMPRESSIONS if given,
+    using a pool of processes (the number of CPUs by default). With
+    background the files are written by a background thread of the worker,
+    with columns only the selected columns of every sheet are written.
+    Yield a tuple (sheetname, csv filename, rows, columns) for each sheet
+    as soon as it is converted.
+    """
+    global _document
+    if sheetnames is None:
+        sheetnames = doc.sheet_names()
+    filename = doc.archive().zip_filename
+    tasks = [(name, csv_filename(filename, name, compression), compression,
+              background, columns)
+             for name in sheetnames]
+    load_shared_parts(doc)
+
+    initargs = (filename, doc.shared_strings_mode, doc.cache_dir,
+                doc.raw_numbers)
+    _document = doc
+    try:
+        if processes == 1:
+            _init_worker(*initargs)
+            for task in tasks:
+                yield _convert_sheet(task)
+            return
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        try:
+            for result in pool.imap_unordered(_convert_sheet, tasks):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    finally:
+        _document = None
+
+def _parse_rows(args):
+    data, sheet_id, row_mode, columns = args
+    strings = _shared_strings
+    if strings is None:
+        strings = _document.sheet_shared_strings(sheet_id)
+    sheet = _document.create_sheet(sheet_id, row_mode, columns)
+    return list(sheet.parse_chunks(
+        [reader.SHEETDATA_START, data, reader.SHEETDATA_END], strings))
+
+def _dimension_chunks(chunks, progress):
+    """ Pass the chunks through, taking the total rows from the first """
+    for chunk in chunks:
+        progress.parse_dimension(chunk)
+        yield chunk
+        break
+    for chunk in chunks:
+        yield chunk
+
+def iter_rows(doc, name, processes=None, row_mode=None, chunk_size=CHUNK_SIZE,
+              columns=None):
+    """
+    Yield the rows of the sheet with the name in order, while the pieces of
+    the sheet are parsed by a pool of processes (the number of CPUs by
+    default). At most two pieces per process are in flight at any time.
+    With columns the rows hold only the selected columns. The progress
+    handler of the document is called as the pieces are handed over.
+    """
+    global _document, _shared_strings
+    if row_mode is None:
+        row_mode = doc.row_mode
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    sheet_id = doc.workbook().sheet_id(name)
+    filename = doc.archive().zip_filename
+    if columns is not None:
+        # header names are looked up once, not in every piece
+        columns = doc.select_columns(name, columns)
+    load_shared_parts(doc)
+
+    initargs = (filename, doc.shared_strings_mode, doc.cache_dir,
+                doc.raw_numbers)
+    progress = None
+    next_report = [time.time() + doc.progress_interval]
+
+    def report_progress(now):
+        progress.elapsed = now - progress.started
+        doc.progress_handler(progress)
+        next_report[0] = now + doc.progress_interval
+
+    def piece_rows(piece):
+        """ Return the rows of a parsed piece and count its progress """
+        result, size = piece
+        rows = result.get()
+        if progress is not None:
+            progress.rows += len(rows)
+            progress.bytes += size
+            now = time.time()
+            if now >= next_report[0]:
+                report_progress(now)
+        return rows
+
+    pool = None
+    fh = None
+    try:
+        _document = doc
+        _shared_strings = doc.sheet_shared_strings(sheet_id)
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        fh = doc.archive().sheet(sheet_id)
+        chunks = iter(lambda: fh.read(chunk_size), '')
+        if doc.progress_handler is not None:
+            info = doc.archive().sheet_info(sheet_id)
+            progress = reader.Progress(info.file_size, info.compress_size)
+            chunks = _dimension_chunks(chunks, progress)
+
+        pending = collections.deque()
+        for data in reader.split_sheet_chunks(chunks):
+            pending.append((pool.apply_async(_parse_rows,
+                                             ((data, sheet_id, row_mode,
+                                               columns),)),
+                            len(data)))
+            if len(pending) >= 2 * processes:
+                for row in piece_rows(pending.popleft()):
+                    yield row
+        while pending:
+            for row in piece_rows(pending.popleft()):
+                yield row
+        pool.close()
+        if progress is not None:
+            progress.finished = True
+            report_progress(time.time())
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if fh is not None:
+            fh.close()
+        if pool is not None:
+            pool.join()
+        _document = None
+        _shared_strings = None
+
+def parse_sheet(doc, name, processes=None, chunk_size=CHUNK_SIZE, columns=None):
+    """
+    Parse the sheet with the name in parallel and produce a row_event() of
+    the document for each row, in the order of the sheet.
+    """
+    for row in iter_rows(doc, name, processes, chunk_size=chunk_size,
+                         columns=columns):
+        doc.row_event(row)
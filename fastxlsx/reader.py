@@ -24,19 +24,740 @@ import xml.parsers.expat
 import zipfile
 import datetime
 import re
+import os
+import sys
+import mmap
+import array
+import struct
+import shutil
+import tempfile
+import threading
+import Queue
+import zlib
+import time
+import bisect
+import itertools
 import xldate
 
+SHEETDATA_START = '<sheetData>'
+SHEETDATA_END = '</sheetData>'
+
+def split_sheet_chunks(chunks):
+    """
+    Yield the content of the sheetData element of the sheet XML chunks in
+    pieces cut before a row element, so each piece holds complete rows.
+    """
+    buf = ''
+    is_sheetdata = False
+    for data in chunks:
+        buf += data
+        if not is_sheetdata:
+            start = buf.find('<sheetData')
+            if start < 0:
+                continue
+            end = buf.find('>', start)
+            if end < 0:
+                continue
+            if buf[end - 1] == '/':
+                return
+            buf = buf[end + 1:]
+            is_sheetdata = True
+        end = buf.find(SHEETDATA_END)
+        if end >= 0:
+            yield buf[:end]
+            return
+        cut = _last_row_start(buf)
+        if cut > 0:
+            yield buf[:cut]
+            buf = buf[cut:]
+    if is_sheetdata and buf:
+        yield buf
+
+def resume_sheet_chunks(fh, chunk_size):
+    """
+    Return sheet XML chunks to parse from fh, positioned at the start of a
+    row element, up to the end of the sheetData element.
+    """
+    chunks = itertools.chain([SHEETDATA_START],
+                             iter(lambda: fh.read(chunk_size), ''))
+    return itertools.chain([SHEETDATA_START], split_sheet_chunks(chunks),
+                           [SHEETDATA_END])
+
+def _last_row_start(buf):
+    pos = len(buf)
+    while True:
+        pos = buf.rfind('<row', 0, pos)
+        if pos < 0 or buf[pos + 4:pos + 5] in ' \t\r\n>':
+            return pos
+
+class ReadAheadReader(object):
+    """
+    File like reader that reads (and so inflates) the wrapped file handle in
+    a background thread into a bounded queue of buffers. zlib releases the
+    GIL, so decompression overlaps with parsing in the main thread.
+    """
+    BUFFER_SIZE = 1024 * 1024
+    QUEUE_DEPTH = 4
+
+    def __init__(self, fh, buffer_size=BUFFER_SIZE, queue_depth=QUEUE_DEPTH):
+        self.fh = fh
+        self.buffer_size = buffer_size
+        self.queue = Queue.Queue(queue_depth)
+        self.buffer = ''
+        self.offset = 0
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read_ahead)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self.stopped.is_set():
+                data = self.fh.read(self.buffer_size)
+                self._put((data, None))
+                if not data:
+                    break
+        except Exception, e:
+            self._put(('', e))
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def read(self, size=-1):
+        if self.offset >= len(self.buffer):
+            if self.eof:
+                return ''
+            self.buffer, error = self.queue.get()
+            self.offset = 0
+            if error is not None:
+                self.eof = True
+                raise error
+            if not self.buffer:
+                self.eof = True
+                return ''
+        if size < 0 or (self.offset == 0 and size >= len(self.buffer)):
+            data = self.buffer[self.offset:] if self.offset else self.buffer
+        else:
+            data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.fh.close()
+
+class ThreadedRows(object):
+    """
+    Iterator over rows produced by a background thread, which consumes the
+    rows iterator (usually parsing a sheet) and hands the rows over in
+    batches through a bounded queue. Once the queue is full the thread
+    waits for the consumer.
+
+    Besides iterating, a consumer like an event loop can poll for batches
+    with get_batch() without blocking. cancel() stops the thread at the
+    next batch boundary.
+    """
+    BATCH_SIZE = 1000
+    QUEUE_DEPTH = 4
+
+    def __init__(self, rows, batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH):
+        self.rows = rows
+        self.batch_size = batch_size
+        self.queue = Queue.Queue(queue_depth)
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._produce)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _produce(self):
+        try:
+            try:
+                batch = []
+                for row in self.rows:
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        if not self._put((batch, None)):
+                            return
+                        batch = []
+                if batch and not self._put((batch, None)):
+                    return
+                self._put(([], None))
+            finally:
+                close = getattr(self.rows, 'close', None)
+                if close is not None:
+                    close()
+        except Exception, e:
+            self._put(([], e))
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def get_batch(self, timeout=None):
+        """
+        Return the next batch of rows, an empty list after the last one.
+        With a timeout (0 doesn't wait at all) raise Queue.Empty if there
+        is no batch in time. Errors of the thread are raised here.
+        """
+        if self.finished:
+            return []
+        if timeout is None:
+            batch, error = self.queue.get()
+        elif timeout == 0:
+            batch, error = self.queue.get_nowait()
+        else:
+            batch, error = self.queue.get(True, timeout)
+        if not batch:
+            self.finished = True
+            self.thread.join()
+            if error is not None:
+                raise error
+        return batch
+
+    def batches(self):
+        """ Generator yielding the batches of rows """
+        try:
+            while True:
+                batch = self.get_batch()
+                if not batch:
+                    break
+                yield batch
+        finally:
+            self.cancel()
+
+    def __iter__(self):
+        for batch in self.batches():
+            for row in batch:
+                yield row
+
+    def cancel(self):
+        """ Stop the thread and drop the pending batches """
+        if self.finished:
+            return
+        self.stopped.set()
+        self.finished = True
+        self.thread.join()
+
+class CheckpointReader(object):
+    """
+    File like reader inflating an archive member from the raw zip data.
+    While reading, a copy of the inflate state is added to checkpoints
+    every checkpoint_spacing decompressed bytes, so a later reader of the
+    same member resumes at the checkpoint before its offset instead of
+    inflating from the start of the member.
+
+    The checkpoints are a sorted list of (offset, compressed offset,
+    decompressor) tuples. They only live in memory, zlib can't save the
+    state of a decompressor.
+
+    The fh is a seekable file handle of the archive, owned by the reader.
+    """
+    READ_SIZE = 64 * 1024
+    CHECKPOINT_SPACING = 16 * 1024 * 1024
+
+    def __init__(self, fh, info, checkpoints=None, offset=0,
+                 checkpoint_spacing=CHECKPOINT_SPACING):
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise NotImplementedError("Unsupported compression method %d" %
+                                      info.compress_type)
+        self.fh = fh
+        self.fh.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader,
+                               self.fh.read(zipfile.sizeFileHeader))
+        self.data_offset = (info.header_offset + zipfile.sizeFileHeader +
+                            header[zipfile._FH_FILENAME_LENGTH] +
+                            header[zipfile._FH_EXTRA_FIELD_LENGTH])
+        self.deflated = info.compress_type == zipfile.ZIP_DEFLATED
+        self.compress_size = info.compress_size
+        if checkpoints is None:
+            checkpoints = []
+        self.checkpoints = checkpoints
+        self.checkpoint_spacing = checkpoint_spacing
+        self.seek(offset)
+
+    def seek(self, offset):
+        """ Continue reading at the decompressed offset """
+        self.buffer = ''
+        self.buffer_offset = 0
+        if not self.deflated:
+            self.position = self.offset = min(offset, self.compress_size)
+            return
+        self.position = self.offset = 0
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        i = bisect.bisect_right(self.checkpoints, (offset, None, None))
+        if i:
+            self.offset, self.position, decompressor = self.checkpoints[i - 1]
+            # the checkpoint stays usable for other readers
+            self.decompressor = decompressor.copy()
+        while self.offset < offset:
+            data = self._inflate()
+            if not data:
+                return
+            if self.offset > offset:
+                self.buffer = data[len(data) - (self.offset - offset):]
+
+    def _inflate(self):
+        """ Return the next piece of decompressed data, '' at the end """
+        size = min(self.READ_SIZE, self.compress_size - self.position)
+        if size <= 0:
+            return ''
+        self.fh.seek(self.data_offset + self.position)
+        raw = self.fh.read(size)
+        if not raw:
+            return ''
+        self.position += len(raw)
+        if not self.deflated:
+            self.offset += len(raw)
+            return raw
+        data = self.decompressor.decompress(raw)
+        if self.position >= self.compress_size:
+            data += self.decompressor.flush()
+        self.offset += len(data)
+        last = self.checkpoints[-1][0] if self.checkpoints else 0
+        if self.offset - last >= self.checkpoint_spacing:
+            self.checkpoints.append((self.offset, self.position,
+                                     self.decompressor.copy()))
+        return data
+
+    def read(self, size=-1):
+        while self.buffer_offset >= len(self.buffer):
+            self.buffer = self._inflate()
+            self.buffer_offset = 0
+            if not self.buffer:
+                return ''
+        start = self.buffer_offset
+        if size < 0:
+            end = len(self.buffer)
+        else:
+            end = min(start + size, len(self.buffer))
+        self.buffer_offset = end
+        if start == 0 and end == len(self.buffer):
+            return self.buffer
+        return self.buffer[start:end]
+
+    def close(self):
+        self.fh.close()
+
+class BufferFile(object):
+    """
+    Seekable file like reader of a buffer, a string or a mmap. Any number
+    of them can read the same buffer, each at its own position.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.position = 0
+
+    def read(self, size=-1):
+        start = self.position
+        if size < 0:
+            end = self.size
+        else:
+            end = min(start + size, self.size)
+        if end <= start:
+            return ''
+        self.position = end
+        return self.buffer[start:end]
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise IOError("Invalid offset %d" % offset)
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        pass
+
 class DocumentArchive(object):
     """
     Represent the document ZIP archive. Provide accessor for file handles
     to fetch the archive files.
+
+    The archive is read from a buffer, a memory map of the file unless
+    given. Every file handle reads the buffer at its own position, so
+    several threads can read parts of the archive at the same time.
+
+    With read_ahead the sheets are inflated by a ReadAheadReader into
+    buffers of buffer_size bytes, queue_depth buffers ahead of the parser.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, read_ahead=False,
+                 buffer_size=ReadAheadReader.BUFFER_SIZE,
+                 queue_depth=ReadAheadReader.QUEUE_DEPTH, buffer=None):
         self.zip_filename = filename
-        self.zip_filehandle = zipfile.ZipFile(filename)
+        if buffer is None:
+            buffer = self.map_file(filename)
+        self.buffer = buffer
+        # only used for the central directory, shared by all threads
+        self.zip_filehandle = zipfile.ZipFile(BufferFile(buffer))
+        self.read_ahead = read_ahead
+        self.buffer_size = buffer_size
+        self.queue_depth = queue_depth
+
+    @staticmethod
+    def map_file(filename):
+        """ Return a read only memory map of the file """
+        f = open(filename, 'rb')
+        try:
+            if not os.fstat(f.fileno()).st_size:
+                raise zipfile.BadZipfile("File is not a zip file")
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+    def filehandle(self, name):
+        """ Return a file handle of the member with its own buffer reader """
+        info = self.zip_filehandle.getinfo(name)
+        if info.flag_bits & 0x1:
+            raise RuntimeError("File %s is encrypted" % name)
+        fh = BufferFile(self.buffer)
+        fh.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader,
+                               fh.read(zipfile.sizeFileHeader))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipfile("Bad magic number for file header")
+        fh.seek(header[zipfile._FH_FILENAME_LENGTH] +
+                header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+        return zipfile.ZipExtFile(fh, 'r', info)
+
+    def workbook(self):
+        return self.filehandle('xl/workbook.xml')
+
+    def sheet(self, id):
+        fh = self.filehandle('xl/worksheets/' + self.sheet_filename(id))
+        if self.read_ahead:
+            return ReadAheadReader(fh, self.buffer_size, self.queue_depth)
+        return fh
+
+    def sheet_filename(self, sheet_id):
+        return u'sheet%s.xml' % sheet_id
+
+    def sheet_info(self, sheet_id):
+        return self.zip_filehandle.getinfo(
+            'xl/worksheets/' + self.sheet_filename(sheet_id))
+
+    def sheet_checkpoint_reader(self, sheet_id, checkpoints, offset=0):
+        """
+        Return a CheckpointReader of the sheet positioned at the
+        decompressed offset, adding to and resuming from the checkpoints.
+        """
+        return CheckpointReader(BufferFile(self.buffer),
+                                self.sheet_info(sheet_id), checkpoints, offset)
+
+    def shared_strings(self):
+        return self.filehandle('xl/sharedStrings.xml')
+
+    def shared_strings_info(self):
+        return self.zip_filehandle.getinfo('xl/sharedStrings.xml')
+
+    def has_shared_strings(self):
+        return 'xl/sharedStrings.xml' in self.zip_filehandle.NameToInfo
+
+    def styles(self):
+        return self.filehandle('xl/styles.xml')
+
+class SpoolReader(object):
+    """ File like reader of a spooled archive member, with its own offset """
+    def __init__(self, spool):
+        self.spool = spool
+        self.offset = 0
+
+    def read(self, size=-1):
+        self.spool.seek(self.offset)
+        data = self.spool.read(size)
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        pass
+
+class ChunkReader(object):
+    """ File like reader of an iterator over pieces of data """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = ''
+        self.offset = 0
+
+    def read(self, size=-1):
+        while self.offset >= len(self.buffer):
+            self.buffer = next(self.chunks, '')
+            self.offset = 0
+            if not self.buffer:
+                return ''
+        start = self.offset
+        if size < 0:
+            end = len(self.buffer)
+        else:
+            end = min(start + size, len(self.buffer))
+        self.offset = end
+        if start == 0 and end == len(self.buffer):
+            return self.buffer
+        return self.buffer[start:end]
+
+    def rest(self):
+        """ Yield the data not read yet """
+        if self.offset < len(self.buffer):
+            yield self.buffer[self.offset:]
+        self.buffer = ''
+        self.offset = 0
+        for data in self.chunks:
+            yield data
+
+    def close(self):
+        pass
+
+class StreamMember(object):
+    """
+    File like reader of an archive member of a StreamArchive. It waits
+    with walking the stream to the member until it is read first. Then it
+    inflates the member directly from the stream, unless the member was
+    spooled already.
+    """
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+        self.reader = None
+
+    def read(self, size=-1):
+        if self.reader is None:
+            self.reader = self.archive.member_reader(self.name, self)
+        return self.reader.read(size)
+
+    def spool(self, spool):
+        """ Continue reading from the spool, after the stream moves on """
+        self.reader = spool
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+        self.archive.release(self)
+
+class StreamArchive(object):
+    """
+    Represent the document ZIP archive read from a non-seekable stream,
+    like a pipe or a socket, with the same accessors as DocumentArchive.
+
+    The members are found by walking their local file headers in order.
+    A member is inflated directly from the stream if it is read when the
+    stream arrived at it. All members the stream walks past meanwhile are
+    spooled, in memory up to spool_size bytes each, into a temporary file
+    beyond. So the sheet is parsed on the fly if the workbook, styles and
+    shared strings come before it, otherwise it is spooled first.
+    """
+    LOCAL_HEADER_SIGNATURE = 'PK\x03\x04'
+    DESCRIPTOR_SIGNATURE = 'PK\x07\x08'
+    FLAG_DATA_DESCRIPTOR = 0x08
+    READ_SIZE = 64 * 1024
+    SPOOL_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, fh, spool_size=SPOOL_SIZE):
+        self.fh = fh
+        self.spool_size = spool_size
+        self.zip_filename = None
+        self.pending = ''
+        self.spools = {}
+        self.infos = {}
+        self.streamed = set()
+        # names of the members with zip64 sizes
+        self.zip64 = set()
+        # the header of the member the stream is at, None at the end
+        self.next_info = None
+        self.at_end = False
+        # the member reading from the stream
+        self.current = None
+        self.current_data = None
+
+    def _read(self, size):
+        """ Return up to size bytes of the stream """
+        if self.pending:
+            data = self.pending[:size]
+            self.pending = self.pending[size:]
+            return data
+        return self.fh.read(size)
+
+    def _read_exactly(self, size):
+        data = ''
+        while len(data) < size:
+            piece = self._read(size - len(data))
+            if not piece:
+                raise zipfile.BadZipfile("Truncated ZIP stream")
+            data += piece
+        return data
+
+    def _read_header(self):
+        """ Read the next local file header, return False at the end """
+        if self.next_info is not None:
+            return True
+        if self.at_end:
+            return False
+        signature = self._read(4)
+        if signature and len(signature) < 4:
+            signature += self._read_exactly(4 - len(signature))
+        if signature != self.LOCAL_HEADER_SIGNATURE:
+            # the central directory or the end of the stream
+            self.at_end = True
+            return False
+        header = struct.unpack(zipfile.structFileHeader,
+                               signature + self._read_exactly(
+                                   zipfile.sizeFileHeader - 4))
+        name = self._read_exactly(header[zipfile._FH_FILENAME_LENGTH])
+        extra = self._read_exactly(header[zipfile._FH_EXTRA_FIELD_LENGTH])
+        info = zipfile.ZipInfo(name)
+        info.flag_bits = header[zipfile._FH_GENERAL_PURPOSE_FLAG_BITS]
+        info.compress_type = header[zipfile._FH_COMPRESSION_METHOD]
+        info.CRC = header[zipfile._FH_CRC]
+        info.compress_size = header[zipfile._FH_COMPRESSED_SIZE]
+        info.file_size = header[zipfile._FH_UNCOMPRESSED_SIZE]
+        info.extra = extra
+        # a zip64 extra field holds the sizes too large for the header
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, length = struct.unpack('<HH', extra[pos:pos + 4])
+            if tag == 1:
+                self.zip64.add(name)
+                sizes = extra[pos + 4:pos + 4 + length]
+                if info.file_size == 0xFFFFFFFF and len(sizes) >= 8:
+                    info.file_size, = struct.unpack('<Q', sizes[:8])
+                    sizes = sizes[8:]
+                if info.compress_size == 0xFFFFFFFF and len(sizes) >= 8:
+                    info.compress_size, = struct.unpack('<Q', sizes[:8])
+            pos += 4 + length
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise NotImplementedError("Unsupported compression method %d" %
+                                      info.compress_type)
+        if (info.flag_bits & self.FLAG_DATA_DESCRIPTOR and
+                info.compress_type == zipfile.ZIP_STORED):
+            raise NotImplementedError(
+                "Stored member %s without sizes can't be streamed" % name)
+        self.infos[name] = info
+        self.next_info = info
+        return True
+
+    def _member_data(self, info):
+        """ Yield the inflated data of the member the stream is at """
+        deflated = info.compress_type == zipfile.ZIP_DEFLATED
+        descriptor = info.flag_bits & self.FLAG_DATA_DESCRIPTOR
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        crc = 0
+        size = 0
+        remaining = info.compress_size
+        while descriptor or remaining > 0:
+            if descriptor:
+                raw = self._read(self.READ_SIZE)
+            else:
+                raw = self._read(min(self.READ_SIZE, remaining))
+                remaining -= len(raw)
+            if not raw:
+                raise zipfile.BadZipfile("Truncated ZIP stream")
+            data = decompressor.decompress(raw) if deflated else raw
+            if data:
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                yield data
+            if descriptor and decompressor.unused_data:
+                # the deflate stream ended, the rest belongs to what follows
+                self.pending = decompressor.unused_data + self.pending
+                break
+        if deflated:
+            data = decompressor.flush()
+            if data:
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                yield data
+        if descriptor:
+            self._read_descriptor(info)
+        if (crc & 0xFFFFFFFF) != info.CRC or size != info.file_size:
+            raise zipfile.BadZipfile("Bad CRC-32 for file %r" % info.filename)
+
+    def _read_descriptor(self, info):
+        """ Read the data descriptor following the data of the member """
+        fmt = '<IQQ' if info.filename in self.zip64 else '<III'
+        data = self._read_exactly(4)
+        if data == self.DESCRIPTOR_SIGNATURE:
+            data = ''
+        data += self._read_exactly(struct.calcsize(fmt) - len(data))
+        info.CRC, info.compress_size, info.file_size = struct.unpack(fmt, data)
+
+    def _advance(self):
+        """
+        Move the stream past the member reading from it, spooling its rest
+        unless it is closed, or past the next member, spooling it.
+        """
+        if self.current_data is not None:
+            member, data = self.current, self.current_data
+            self.current = self.current_data = None
+            if member is None:
+                for piece in data.rest():
+                    pass
+            else:
+                member.spool(SpoolReader(self._spool(member.name,
+                                                     data.rest())))
+            return
+        info = self.next_info
+        self.next_info = None
+        self._spool(info.filename, self._member_data(info))
+
+    def _spool(self, name, data):
+        spool = tempfile.SpooledTemporaryFile(self.spool_size)
+        for piece in data:
+            spool.write(piece)
+        self.spools[name] = spool
+        return spool
+
+    def _walk_to(self, name):
+        """ Walk the stream to the member with the name, False if missing """
+        while True:
+            if name in self.spools or name in self.streamed:
+                return True
+            if self.current_data is not None:
+                self._advance()
+                continue
+            if not self._read_header():
+                return False
+            if self.next_info.filename == name:
+                return True
+            self._advance()
+
+    def member_reader(self, name, member):
+        """ Return the reader of the member for a StreamMember """
+        if not self._walk_to(name):
+            raise KeyError("There is no item named %r in the archive" % name)
+        if name in self.spools:
+            return SpoolReader(self.spools[name])
+        if name in self.streamed:
+            raise IOError("Member %s was already read from the stream" % name)
+        info = self.next_info
+        self.next_info = None
+        self.streamed.add(name)
+        self.current = member
+        self.current_data = ChunkReader(self._member_data(info))
+        return self.current_data
+
+    def release(self, member):
+        """ Skip the rest of the member once it is closed """
+        if self.current is member:
+            self.current = None
 
     def filehandle(self, name):
-        return self.zip_filehandle.open(name, 'r')
+        return StreamMember(self, name)
 
     def workbook(self):
         return self.filehandle('xl/workbook.xml')
@@ -47,52 +768,471 @@ class DocumentArchive(object):
     def sheet_filename(self, sheet_id):
         return u'sheet%s.xml' % sheet_id
 
+    def sheet_info(self, sheet_id):
+        name = 'xl/worksheets/' + self.sheet_filename(sheet_id)
+        if not self._walk_to(name):
+            raise KeyError("There is no item named %r in the archive" % name)
+        return self.infos[name]
+
+    def sheet_checkpoint_reader(self, sheet_id, checkpoints, offset=0):
+        raise NotImplementedError("Can't seek in a ZIP stream")
+
     def shared_strings(self):
         return self.filehandle('xl/sharedStrings.xml')
 
+    def shared_strings_info(self):
+        raise NotImplementedError("No sidecar files for a ZIP stream")
+
+    def has_shared_strings(self):
+        return self._walk_to('xl/sharedStrings.xml')
+
     def styles(self):
         return self.filehandle('xl/styles.xml')
 
-class SharedStrings(list):
-    """ Parse the shared string list and store it as list for lookup. """
-    def __init__(self, archive):
+class SharedStringsParser(object):
+    """
+    Parse the shared string table and call add(string) for each entry.
+    Rich text runs are concatenated, phonetic hints are skipped.
+    """
+    def __init__(self, add):
+        self.add = add
+        self.is_string = False
+        self.is_phonetic = False
+        self.data = None
+
+    def parse(self, archive):
         parser = xml.parsers.expat.ParserCreate()
         parser.StartElementHandler = self._start_element
         parser.EndElementHandler = self._end_element
         parser.CharacterDataHandler = self._char_data
 
-        self.is_string = False
-        self.data = None
-        self.index = 0
-
         fh = archive.shared_strings()
         parser.ParseFile(fh)
         fh.close()
 
     def _start_element(self, name, attrs):
-        if name == 'si':
-            self.is_string = True
+        if name == 't':
+            self.is_string = not self.is_phonetic
+        elif name == 'si':
+            self.data = u''
+        elif name == 'rPh':
+            self.is_phonetic = True
 
     def _end_element(self, name):
         self.is_string = False
         if name == 'si':
-            self.append(self.data)
+            self.add(self.data)
             self.data = None
+        elif name == 'rPh':
+            self.is_phonetic = False
 
     def _char_data(self, data):
         if self.is_string is True:
-            if self.data is None:
-                self.data = data
+            self.data += data
+
+class SharedStrings(list):
+    """ Parse the shared string list and store it as list for lookup. """
+    def __init__(self, archive):
+        SharedStringsParser(self.append).parse(archive)
+
+class MappedSharedStrings(object):
+    """
+    Shared string table backed by a memory mapped sidecar file. The sidecar
+    holds an offset table and the UTF-8 encoded strings and is keyed by the
+    CRC and size of the sharedStrings.xml archive member. Strings are only
+    decoded on lookup, so repeated reads of a workbook don't parse any XML
+    and several processes share the page cache of the same sidecar.
+    """
+    MAGIC = 'FXLSXSS1'
+    # magic, crc, member size, string count, offset item size, byte order
+    HEADER = struct.Struct('<8sIQQB?7x')
+    OFFSET_FORMATS = {4: '<II', 8: '<QQ'}
+
+    def __init__(self, filename):
+        self.filename = filename
+        f = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if len(self._map) < self.HEADER.size:
+            self.close()
+            raise ValueError("Not a shared strings sidecar: %s" % filename)
+        (magic, self.crc, self.size, self._count, itemsize,
+         big_endian) = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or itemsize not in self.OFFSET_FORMATS:
+            self.close()
+            raise ValueError("Not a shared strings sidecar: %s" % filename)
+        fmt = self.OFFSET_FORMATS[itemsize]
+        if big_endian:
+            fmt = '>' + fmt[1:]
+        self._offset = struct.Struct(fmt)
+        self._itemsize = itemsize
+        self._blob = self.HEADER.size + (self._count + 1) * itemsize
+
+    @classmethod
+    def open(cls, archive, cache_dir=None):
+        """
+        Open the sidecar for the shared strings of the archive, (re)build it
+        if it is missing, unreadable or doesn't match the archive member.
+        If it can't be written the strings are kept in memory instead, see
+        CompactSharedStrings.
+        """
+        info = archive.shared_strings_info()
+        filename = cls.sidecar_filename(archive, info, cache_dir)
+        if os.path.exists(filename):
+            try:
+                strings = cls(filename)
+            except (ValueError, EnvironmentError):
+                pass
             else:
-                self.data += data
+                if (strings.crc == info.CRC and
+                        strings.size == info.file_size):
+                    return strings
+                strings.close()
+        try:
+            cls.build(archive, filename, info)
+            return cls(filename)
+        except (OSError, IOError):
+            # the sidecar is a cache, go on with the strings in memory
+            return CompactSharedStrings(archive)
+
+    @staticmethod
+    def sidecar_filename(archive, info, cache_dir=None):
+        if cache_dir is None:
+            return archive.zip_filename + '.sst'
+        name = os.path.basename(archive.zip_filename)
+        return os.path.join(cache_dir, '%s-%08x-%d.sst' % (
+            name, info.CRC, info.file_size))
+
+    @classmethod
+    def build(cls, archive, filename, info):
+        """ Parse the shared strings of the archive into a sidecar file """
+        offsets = array.array('L', [0])
+        directory = os.path.dirname(os.path.abspath(filename))
+        blob = tempfile.TemporaryFile(dir=directory)
+        try:
+            def add(string):
+                data = string.encode('UTF-8')
+                blob.write(data)
+                offsets.append(offsets[-1] + len(data))
+            SharedStringsParser(add).parse(archive)
+
+            fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            out = os.fdopen(fd, 'wb')
+            try:
+                out.write(cls.HEADER.pack(
+                    cls.MAGIC, info.CRC, info.file_size, len(offsets) - 1,
+                    offsets.itemsize, sys.byteorder == 'big'))
+                offsets.tofile(out)
+                blob.seek(0)
+                shutil.copyfileobj(blob, out)
+                out.close()
+                os.chmod(tmpname, 0644)
+                # atomic replace, concurrent builders don't see partial files
+                os.rename(tmpname, filename)
+            except:
+                out.close()
+                os.unlink(tmpname)
+                raise
+        finally:
+            blob.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self._count:
+            raise IndexError("shared string index out of range")
+        start, end = self._offset.unpack_from(
+            self._map, self.HEADER.size + idx * self._itemsize)
+        return self._map[self._blob + start:self._blob + end].decode('UTF-8')
+
+class CompactSharedStrings(object):
+    """
+    Shared string table stored as one UTF-8 encoded buffer with an offset
+    table instead of a python object per string. A string is only decoded
+    on lookup; the last cache_size decoded strings are kept in a small
+    cache that is flushed when full (use 0 to disable it).
+    """
+    def __init__(self, archive, cache_size=256):
+        self._blob = bytearray()
+        self._offsets = array.array('L', [0])
+        self._cache = {}
+        self._cache_size = cache_size
+        SharedStringsParser(self._add).parse(archive)
+
+    def _add(self, string):
+        self._blob += string.encode('UTF-8')
+        self._offsets.append(len(self._blob))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        try:
+            return self._cache[idx]
+        except KeyError:
+            pass
+        if not 0 <= idx < len(self._offsets) - 1:
+            raise IndexError("shared string index out of range")
+        string = self._blob[self._offsets[idx]:self._offsets[idx + 1]].decode('UTF-8')
+        if self._cache_size:
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[idx] = string
+        return string
+
+class SparseSharedStrings(dict):
+    """
+    Store only the shared strings whose index is in wanted, keyed by index.
+    Used for sheets referencing a small part of the shared string table.
+    """
+    def __init__(self, archive, wanted):
+        self.count = 0
+        if wanted:
+            SharedStringsParser(self._add(wanted)).parse(archive)
+
+    def _add(self, wanted):
+        def add(string):
+            if self.count in wanted:
+                self[self.count] = string
+            self.count += 1
+        return add
+
+class SheetStringReferences(set):
+    """ Collect the indices of the shared strings used in a sheet """
+    def __init__(self, archive, sheet_id):
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._char_data
+
+        self.is_shared_string = False
+        self.is_value = False
+        self.data = None
+
+        fh = archive.sheet(sheet_id)
+        parser.ParseFile(fh)
+        fh.close()
+
+    def _start_element(self, name, attrs):
+        if name == 'c':
+            self.is_shared_string = attrs.get(u't') == Sheet.TYPE_SHARED_STRING
+        elif name == 'v':
+            self.is_value = self.is_shared_string
+            self.data = u''
+
+    def _end_element(self, name):
+        if name == 'v' and self.is_value:
+            # an empty value references no string
+            if self.data.strip():
+                self.add(int(self.data, 10))
+            self.is_value = False
+
+    def _char_data(self, data):
+        if self.is_value:
+            self.data += data
+
+class RowIndex(object):
+    """
+    Index of the decompressed byte offset of every interval-th row of a
+    sheet, so reading a range of rows starts parsing next to the first of
+    them. The index is built in one pass over the sheet and stored in a
+    sidecar file, keyed by the CRC and size of the sheet archive member
+    like the MappedSharedStrings.
+
+    The inflate checkpoints of the sheet, see CheckpointReader, are
+    collected while the sheet is read in this process; skipping to an
+    offset costs inflating the data from the checkpoint before it, but no
+    parsing.
+    """
+    MAGIC = 'FXLSXRI1'
+    # magic, crc, member size, interval, row count, offset count
+    HEADER = struct.Struct('<8sIQIQQ')
+    INTERVAL = 1000
+
+    def __init__(self, crc, size, interval, rows, offsets):
+        self.crc = crc
+        self.size = size
+        self.interval = interval
+        self.rows = rows
+        self.offsets = offsets
+        self.checkpoints = []
+
+    @classmethod
+    def open(cls, archive, sheet_id, cache_dir=None, interval=INTERVAL):
+        """
+        Load the index sidecar of the sheet, (re)build it if it is missing,
+        doesn't match the archive member or has another interval.
+        """
+        info = archive.sheet_info(sheet_id)
+        if archive.zip_filename is None:
+            # a document read from a buffer has no place for a sidecar
+            return cls.build(archive, sheet_id, info, interval)
+        filename = cls.sidecar_filename(archive, sheet_id, info, cache_dir)
+        if os.path.exists(filename):
+            index = cls.load(filename)
+            if (index.crc == info.CRC and index.size == info.file_size and
+                    index.interval == interval):
+                return index
+        index = cls.build(archive, sheet_id, info, interval)
+        try:
+            index.save(filename)
+        except (OSError, IOError):
+            # the sidecar is a cache, go on with the index in memory
+            pass
+        return index
+
+    @staticmethod
+    def sidecar_filename(archive, sheet_id, info, cache_dir=None):
+        if cache_dir is None:
+            return '%s.sheet%s.idx' % (archive.zip_filename, sheet_id)
+        name = os.path.basename(archive.zip_filename)
+        return os.path.join(cache_dir, '%s-sheet%s-%08x-%d.idx' % (
+            name, sheet_id, info.CRC, info.file_size))
+
+    @classmethod
+    def load(cls, filename):
+        f = open(filename, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        (magic, crc, size, interval, rows,
+         count) = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a row index sidecar: %s" % filename)
+        offsets = struct.unpack_from('<%dQ' % count, data, cls.HEADER.size)
+        return cls(crc, size, interval, rows, list(offsets))
+
+    @classmethod
+    def build(cls, archive, sheet_id, info, interval=INTERVAL):
+        """ Read the whole sheet and index the offset of its rows """
+        index = cls(info.CRC, info.file_size, interval, 0, [])
+        parser = xml.parsers.expat.ParserCreate()
+
+        def start_element(name, attrs):
+            if name == 'row':
+                if index.rows % interval == 0:
+                    index.offsets.append(parser.CurrentByteIndex)
+                index.rows += 1
+        parser.StartElementHandler = start_element
+
+        fh = archive.sheet_checkpoint_reader(sheet_id, index.checkpoints)
+        try:
+            parser.ParseFile(fh)
+        finally:
+            fh.close()
+        return index
+
+    def save(self, filename):
+        """ Write the index to the sidecar file, replacing it atomically """
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        out = os.fdopen(fd, 'wb')
+        try:
+            out.write(self.HEADER.pack(self.MAGIC, self.crc, self.size,
+                                       self.interval, self.rows,
+                                       len(self.offsets)))
+            out.write(struct.pack('<%dQ' % len(self.offsets), *self.offsets))
+            out.close()
+            os.chmod(tmpname, 0644)
+            os.rename(tmpname, filename)
+        except:
+            out.close()
+            os.unlink(tmpname)
+            raise
+
+    def __len__(self):
+        """ Return the number of rows of the sheet """
+        return self.rows
+
+    def lookup(self, row):
+        """
+        Return the number of the indexed row at or before the row (counted
+        from 0) and its offset, or None if the sheet has no such row.
+        """
+        if not 0 <= row < self.rows:
+            return None
+        i = row // self.interval
+        return i * self.interval, self.offsets[i]
+
+class DateConverter(object):
+    """
+    Convert Excel serial dates of the datemode (0: 1900 based, 1: 1904
+    based) into date, datetime and time values. The date of a day number
+    is computed once and kept in a cache of up to cache_size days, which is
+    flushed when full. Invalid serials raise a ValueError like xldate.
+    """
+    CACHE_SIZE = 65536
+
+    def __init__(self, datemode=0, cache_size=CACHE_SIZE):
+        if datemode not in (0, 1):
+            raise xldate.XLDateBadDatemode(datemode)
+        self.datemode = datemode
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def day(self, days):
+        """ Return the date of the day number """
+        try:
+            return self.cache[days]
+        except KeyError:
+            pass
+        date = datetime.date(*xldate.xldate_as_tuple(days, self.datemode)[:3])
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[days] = date
+        return date
+
+    @staticmethod
+    def split(serial):
+        """ Return the day number and the seconds of the day of the serial """
+        if serial < 0.0:
+            raise xldate.XLDateNegative(serial)
+        days = int(serial)
+        seconds = int(round((serial - days) * 86400.0))
+        if seconds == 86400:
+            return days + 1, 0
+        return days, seconds
+
+    def as_date(self, serial):
+        return self.day(self.split(serial)[0])
+
+    def as_datetime(self, serial):
+        days, seconds = self.split(serial)
+        d = self.day(days)
+        minutes, second = divmod(seconds, 60)
+        hour, minute = divmod(minutes, 60)
+        return datetime.datetime(d.year, d.month, d.day, hour, minute, second)
+
+    def as_time(self, serial):
+        days, seconds = self.split(serial)
+        if days:
+            # validates the day like xldate
+            self.day(days)
+        minutes, second = divmod(seconds, 60)
+        hour, minute = divmod(minutes, 60)
+        return datetime.time(hour, minute, second)
 
 class Styles(object):
-    """ Parse style file and provide methods to work with styles and formats. """
-    def _dateWrapper(*args):
-        if len(args) == 6:
-            return datetime.datetime(*args)
-        else:
-            return datetime.date(*args)
+    """
+    Parse style file and provide methods to work with styles and formats.
+    After loading, converters holds a ready-to-call function per cell style
+    index that turns the raw cell content into a python value, cell_types
+    the python type of the style. select_converters() returns them with
+    dates kept as serial numbers or numbers as stored instead.
+
+    The custom number formats of the numFmts element are classified once
+    by their format code into one of the python types of the builtin
+    formats, see classify_format().
+    """
     BUILTIN_FMT = 0
     BUILTIN_TYPE = 1
     # Stolen from perls Spreadsheet::XLSX
@@ -111,10 +1251,10 @@ class Styles(object):
         0x0B: ('0.00E+00', float),
         0x0C: ('# ?/?', float),
         0x0D: ('# ??/??', float),
-        0x0E: ('m-d-yy', _dateWrapper),
-        0x0F: ('d-mmm-yy', _dateWrapper),
-        0x10: ('d-mmm', _dateWrapper),
-        0x11: ('mmm-yy', _dateWrapper),
+        0x0E: ('m-d-yy', datetime.date),
+        0x0F: ('d-mmm-yy', datetime.date),
+        0x10: ('d-mmm', datetime.date),
+        0x11: ('mmm-yy', datetime.date),
         0x12: ('h:mm AM/PM', datetime.time),
         0x13: ('h:mm:ss AM/PM', datetime.time),
         0x14: ('h:mm', datetime.time),
@@ -135,13 +1275,25 @@ class Styles(object):
         0x30: ('##0.0E+0', float),
         0x31: ('@', unicode),
     }
+    GENERAL = ('General', unicode)
+    # the python type of the builtin format codes, see classify_format()
+    BUILTIN_CODE_TYPES = dict((fmt.lower(), t)
+                              for fmt, t in BUILTIN_NUM_FMTS.values())
 
-    def __init__(self, archive):
+    # parts of a format code without meaning for its type
+    format_literal_re = re.compile(r'"[^"]*"|\\.|_.|\*.')
+    format_bracket_re = re.compile(r'\[([^\]]*)\]')
+    format_elapsed_re = re.compile(r'^(h+|m+|s+)$', re.I)
+    format_ampm_re = re.compile(r'AM/PM|A/P', re.I)
+
+    def __init__(self, archive, datemode=0):
         parser = xml.parsers.expat.ParserCreate()
         parser.StartElementHandler = self._start_element
         parser.EndElementHandler = self._end_element
         parser.CharacterDataHandler = self._char_data
 
+        self.dates = DateConverter(datemode)
+        self.number_formats = dict(self.BUILTIN_NUM_FMTS)
         self._numberFormats = []
         self._inCellXfs = False
         self.current_style = None
@@ -150,8 +1302,17 @@ class Styles(object):
         parser.ParseFile(fh)
         fh.close()
 
+        self.converters = [self._compile_converter(style)
+                           for style in self._numberFormats]
+        self.cell_types = [self.cell_type_from_style(style)
+                           for style in self._numberFormats]
+
     def _start_element(self, name, attrs):
-        if name == 'cellXfs':
+        if name == 'numFmt':
+            code = attrs.get(u'formatCode', u'')
+            self.number_formats[int(attrs[u'numFmtId'])] = (
+                code, self.classify_format(code))
+        elif name == 'cellXfs':
             self._inCellXfs = True
         elif self._inCellXfs and name == 'xf':
             self.current_style = {
@@ -184,26 +1345,145 @@ class Styles(object):
     def cell_type_from_style(self, style):
         """ Return a python type object from style """
         numFmt = style['numFmt']
-        if numFmt >= 0xA0:
-            raise RuntimeError("Custom formats not supported yet")
-        return self.BUILTIN_NUM_FMTS.get(numFmt, unicode)[self.BUILTIN_TYPE]
+        return self.number_formats.get(numFmt, self.GENERAL)[self.BUILTIN_TYPE]
+
+    @classmethod
+    def classify_format(cls, code):
+        """
+        Return the python type of the values shown with the format code:
+        datetime.date, datetime.datetime or datetime.time for dates and
+        times, datetime.timedelta for elapsed time and minutes with seconds,
+        float for percent, fraction, scientific and decimal formats, int for
+        integer formats and unicode for text and anything else. The code of
+        a builtin format gets the type of the builtin format.
+        """
+        builtin = cls.BUILTIN_CODE_TYPES.get(code.lower())
+        if builtin is not None:
+            return builtin
+        # the first section is the one for positive numbers
+        section = cls.format_literal_re.sub('', code)
+        section = section.split(';')[0]
+        elapsed = False
+        for m in cls.format_bracket_re.finditer(section):
+            if cls.format_elapsed_re.match(m.group(1)):
+                elapsed = True
+        if elapsed:
+            return datetime.timedelta
+        section = cls.format_bracket_re.sub('', section)
+        is_time = cls.format_ampm_re.search(section) is not None
+        section = cls.format_ampm_re.sub('', section).lower()
+        section = section.replace('general', '')
+        is_date = 'y' in section or 'd' in section
+        if 'h' in section or 's' in section:
+            if not is_time and not is_date and 'h' not in section:
+                # minutes and seconds without hours, like mm:ss
+                return datetime.timedelta
+            is_time = True
+        elif 'm' in section:
+            # m is the minute next to hours or seconds, the month otherwise
+            is_date = True
+        if is_date and is_time:
+            return datetime.datetime
+        elif is_date:
+            return datetime.date
+        elif is_time:
+            return datetime.time
+        elif '%' in section or '?' in section or 'e' in section:
+            return float
+        elif '.' in section and ('0' in section or '#' in section):
+            return float
+        elif '0' in section or '#' in section:
+            return int
+        return unicode
+
+    def select_converters(self, raw_dates=False, raw_numbers=False):
+        """
+        Return the converters by style index, with raw_dates keeping dates
+        as serial numbers and with raw_numbers keeping the text of numbers.
+        """
+        date_types = (datetime.datetime, datetime.date, datetime.time)
+        number_types = (int, float)
+        converters = []
+        for c, t in zip(self.converters, self.cell_types):
+            if raw_dates and t in date_types:
+                c = self._serial_value
+            elif raw_numbers and t in number_types:
+                c = unicode
+            converters.append(c)
+        return converters
+
+    def _compile_converter(self, style):
+        """ Return a function converting raw cell content of style """
+        cellType = self.cell_type_from_style(style)
+        if cellType is int:
+            return self._int_value
+        elif cellType in (datetime.datetime, datetime.date, datetime.time):
+            return self._date_converter(cellType)
+        elif cellType is datetime.timedelta:
+            return self._timedelta_value
+        return cellType
+
+    @staticmethod
+    def _int_value(value):
+        try:
+            return int(value)
+        except ValueError:
+            # integer formats may still contain a fraction
+            v = float(value)
+            if v.is_integer():
+                return int(v)
+            return v
+
+    @staticmethod
+    def _timedelta_value(value):
+        return datetime.timedelta(days=float(value))
+
+    @staticmethod
+    def _serial_value(value):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    def _date_converter(self, cellType):
+        """ Return a function converting an excel date value to cellType """
+        if cellType is datetime.time:
+            make = self.dates.as_time
+        elif cellType is datetime.date:
+            make = self.dates.as_date
+        else:
+            make = self.dates.as_datetime
+
+        def convert(value):
+            try:
+                return make(float(value))
+            except ValueError:
+                print "Invalid date, assume text or number content:", value
+                if re.match(r'^\d+$', value):
+                    return int(value)
+                elif re.match(r'^\d+\.\d+$', value):
+                    return float(value)
+                return value
+        return convert
 
     def cell_format_from_style(self, style):
         """ Return a format string for style """
         numFmt = style['numFmt']
-        if numFmt >= 0xA0:
-            raise RuntimeError("Custom formats not supported yet")
-        return self.BUILTIN_NUM_FMTS.get(numFmt, unicode)[self.BUILTIN_FMT]
+        return self.number_formats.get(numFmt, self.GENERAL)[self.BUILTIN_FMT]
 
 
 class Workbook(dict):
-    """ Represent the workbook with an index of all work sheets """
+    """
+    Represent the workbook with an index of all work sheets. The datemode
+    is 1 for workbooks with dates based on 1904 (date1904), 0 otherwise.
+    """
     def __init__(self, archive):
         parser = xml.parsers.expat.ParserCreate()
         parser.StartElementHandler = self._start_element
         parser.EndElementHandler = self._end_element
         parser.CharacterDataHandler = self._char_data
 
+        self.datemode = 0
         fh = archive.workbook()
         parser.ParseFile(fh)
         fh.close()
@@ -211,6 +1491,9 @@ class Workbook(dict):
     def _start_element(self, name, attrs):
         if name == 'sheet':
             self[attrs['name']] = attrs
+        elif name == 'workbookPr':
+            if attrs.get(u'date1904', u'0').lower() in (u'1', u'true'):
+                self.datemode = 1
 
     def _end_element(self, name):
         pass
@@ -229,10 +1512,256 @@ class Workbook(dict):
             return
         return meta[u'sheetId']
 
+class Cell(object):
+    """ Compact cell with the value, the column number and the style index """
+    __slots__ = ('value', 'column', 'style_idx')
+
+    def __init__(self, value, column, style_idx):
+        self.value = value
+        self.column = column
+        self.style_idx = style_idx
+
+    def __repr__(self):
+        return 'Cell(%r, %r, %r)' % (self.value, self.column, self.style_idx)
+
+class LazyCell(object):
+    """
+    Cell keeping the raw content of its value element, with the column
+    number, the style index and the cell type. The value is converted on
+    first access and kept.
+    """
+    __slots__ = ('raw', 'column', 'style_idx', 'cell_type', '_convert',
+                 '_value')
+
+    def __init__(self, raw, column, style_idx, cell_type, convert=None):
+        """
+        The convert function turns raw into the value, without one the raw
+        content is the value already.
+        """
+        self.raw = raw
+        self.column = column
+        self.style_idx = style_idx
+        self.cell_type = cell_type
+        self._convert = convert
+        self._value = u'' if raw is None else raw
+
+    @property
+    def value(self):
+        if self._convert is not None:
+            self._value = self._convert(self.raw)
+            self._convert = None
+        return self._value
+
+    def __reduce__(self):
+        # the convert function can't be pickled, hand over the value
+        return (_resolved_lazy_cell, (self.raw, self.column, self.style_idx,
+                                      self.cell_type, self.value))
+
+    def __repr__(self):
+        return 'LazyCell(%r, %r, %r, %r)' % (self.raw, self.column,
+                                             self.style_idx, self.cell_type)
+
+def _resolved_lazy_cell(raw, column, style_idx, cell_type, value):
+    """ Return a LazyCell with the value converted already """
+    cell = LazyCell(raw, column, style_idx, cell_type)
+    cell._value = value
+    return cell
+
+class Progress(object):
+    """
+    Progress of reading a sheet, passed to the progress handler of the
+    document. The bytes are the uncompressed bytes of the sheet read so
+    far, total_bytes and compressed_size the sizes of the sheet archive
+    member. The total_rows are taken from the dimension element of the
+    sheet, None if it has none. It counts empty rows that are not stored,
+    so it is an upper bound.
+    """
+    INTERVAL = 1.0
+    MB = 1024.0 * 1024.0
+    dimension_re = re.compile(
+        r'<dimension\s+ref=["\'][A-Z]*(\d+)(?::[A-Z]*(\d+))?["\']')
+
+    def __init__(self, total_bytes, compressed_size):
+        self.rows = 0
+        self.bytes = 0
+        self.total_bytes = total_bytes
+        self.compressed_size = compressed_size
+        self.total_rows = None
+        self.started = time.time()
+        self.elapsed = 0.0
+        self.finished = False
+
+    def parse_dimension(self, data):
+        """ Take total_rows from the dimension element in the data """
+        m = self.dimension_re.search(data)
+        if m is not None:
+            first, last = m.groups()
+            if last is None:
+                self.total_rows = int(first)
+            else:
+                self.total_rows = int(last) - int(first) + 1
+
+    def fraction(self):
+        """ Return the part of the sheet read so far, from 0.0 to 1.0 """
+        if self.finished:
+            return 1.0
+        if not self.total_bytes:
+            return 0.0
+        return min(float(self.bytes) / self.total_bytes, 1.0)
+
+    def compressed_bytes(self):
+        """ Return the estimated compressed bytes of the sheet read so far """
+        return int(self.compressed_size * self.fraction())
+
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def mb_per_second(self):
+        """ Return the uncompressed MB parsed per second """
+        if not self.elapsed:
+            return 0.0
+        return self.bytes / self.MB / self.elapsed
+
+    def eta(self):
+        """ Return the estimated seconds left, None if unknown """
+        fraction = self.fraction()
+        if not fraction:
+            return None
+        return self.elapsed / fraction - self.elapsed
+
+    def __str__(self):
+        if self.total_rows is None:
+            rows = 'Row %d' % self.rows
+        else:
+            rows = 'Row %d of %d' % (self.rows, self.total_rows)
+        eta = self.eta()
+        if eta is None:
+            eta = '?'
+        else:
+            eta = str(datetime.timedelta(seconds=int(eta)))
+        return '%s, %.1f%%, %.0f rows/s, %.1f MB/s, ETA %s' % (
+            rows, self.fraction() * 100, self.rows_per_second(),
+            self.mb_per_second(), eta)
+
+class Stats(object):
+    """
+    Counters and timers (in seconds) of the phases of reading sheets,
+    collected only after Document.enable_stats(). Collecting them slows
+    down the parser, the numbers are meant to compare the phases.
+
+    The parse timer includes all time spent producing rows, so also the
+    inflate, shared_strings, styles, convert and dates timers. The time of
+    expat or the scanner itself is what remains, see parser_time().
+
+    Lazy cells are converted when their value is used, after the row is
+    produced. With a ROW_LAZY sheet, lazy is set and the conversion timers
+    are left out of the report.
+    """
+    TIMERS = ('inflate', 'parse', 'shared_strings', 'styles', 'convert',
+              'dates', 'handlers')
+    # the timers of the conversion, not taken for lazy cells
+    LAZY_TIMERS = ('shared_strings', 'convert', 'dates')
+    COUNTERS = ('rows', 'cells', 'fillers', 'bytes')
+
+    def __init__(self):
+        self.times = dict.fromkeys(self.TIMERS, 0.0)
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.lazy = False
+
+    def timed(self, timer, function):
+        """ Return function wrapped to add its run time to the timer """
+        times = self.times
+        def timed(*args):
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                times[timer] += time.time() - start
+        return timed
+
+    def counted(self, counter, function):
+        """ Return function wrapped to count its calls """
+        counts = self.counts
+        def counted(*args):
+            counts[counter] += 1
+            return function(*args)
+        return counted
+
+    def timed_chunks(self, read, size):
+        """ Yield chunks of read(size) timed as inflate until it's empty """
+        times = self.times
+        counts = self.counts
+        while True:
+            start = time.time()
+            chunk = read(size)
+            times['inflate'] += time.time() - start
+            if not chunk:
+                break
+            counts['bytes'] += len(chunk)
+            yield chunk
+
+    def timed_rows(self, rows):
+        """ Pass the rows through, timing their production as parse """
+        times = self.times
+        counts = self.counts
+        rows = iter(rows)
+        while True:
+            start = time.time()
+            try:
+                row = rows.next()
+            finally:
+                times['parse'] += time.time() - start
+            counts['rows'] += 1
+            yield row
+
+    def parser_time(self):
+        """ Return the time of expat or the scanner itself """
+        times = self.times
+        return times['parse'] - sum(times[t] for t in (
+            'inflate', 'shared_strings', 'styles', 'convert', 'dates'))
+
+    def __str__(self):
+        timers = self.TIMERS
+        if self.lazy:
+            timers = [t for t in timers if t not in self.LAZY_TIMERS]
+        lines = ['%-16s %10.3fs' % (t, self.times[t]) for t in timers]
+        lines.insert(2, '%-16s %10.3fs' % ('  parser', self.parser_time()))
+        lines.extend('%-16s %11d' % (c, self.counts[c])
+                     for c in self.COUNTERS)
+        return '\n'.join(lines)
+
+class TimedLookup(object):
+    """ Sequence wrapper adding the time of lookups to a Stats timer """
+    def __init__(self, sequence, stats, timer):
+        self.sequence = sequence
+        self.lookup = stats.timed(timer, sequence.__getitem__)
+
+    def __getitem__(self, idx):
+        return self.lookup(idx)
+
+    def __len__(self):
+        return len(self.sequence)
+
+def print_progress(progress):
+    """ Progress handler printing a status line """
+    print "\r%s       " % progress,
+    sys.stdout.flush()
+
 class Sheet(object):
     """
     Parse a sheet row by row and produce a row_event() for each finished row.
     This is the part where the cell content is parsed too.
+
+    The row_mode selects the representation of the rows: ROW_DICT delivers
+    a list with a dict per cell, ROW_CELLS a list of Cell objects and
+    ROW_VALUES a tuple with only the cell values. ROW_LAZY delivers a list
+    of LazyCell objects, which convert their value only when it is used.
+
+    With columns, a list of column numbers (1 is A), the rows hold only the
+    cells of these columns in the given order. Cells of other columns are
+    skipped before their content is converted.
     """
     STYLE_IDX = 'i'
     STYLE = 's'
@@ -242,130 +1771,334 @@ class Sheet(object):
     VALUE = 'v'
     TYPE = 't'
     TYPE_SHARED_STRING = u's'
+    TEXT_TYPES = (u'str', u'inlineStr', u'e')
     GENERATED_CELL = 'g'
 
+    ROW_DICT = 'dict'
+    ROW_VALUES = 'values'
+    ROW_CELLS = 'cells'
+    ROW_LAZY = 'lazy'
+
     rel_re = re.compile(r'([A-Z]+)(\d+)')
+    # column number of the column letters, shared by all sheets
+    column_numbers = {}
+    letters_re = re.compile(r'^[A-Z]+$')
+    # keep dates as serial numbers, for callers converting them in batches
+    raw_dates = False
+    # keep the text of numbers, for callers writing them out unchanged
+    raw_numbers = False
     MAX_COLUMNS = 1024
+    CHUNK_SIZE = 64 * 1024
 
-    def __init__(self, doc, archive, sheet_id):
+    def __init__(self, doc, archive, sheet_id, row_mode=ROW_DICT,
+                 columns=None):
         self.document = doc
-
-        parser = xml.parsers.expat.ParserCreate()
-        parser.StartElementHandler = self._start_element
-        parser.EndElementHandler = self._end_element
-        parser.CharacterDataHandler = self._char_data
+        self.archive = archive
+        self.sheet_id = sheet_id
+        self.row_mode = row_mode
+        self.selected = columns
+        # position in the row by column number of the selected columns
+        self.selection = None
+        if columns is not None:
+            self.selection = dict((c, i) for i, c in enumerate(columns))
+            if len(self.selection) != len(columns):
+                raise ValueError("Column selected twice: %r" % (columns,))
 
         self.data = None
         self.is_sheetdata = False
         self.row_count = 0
         self.current_row = None
         self.cell = None
+        self.row_ref = None
         self.is_value = False
+        self.finished_rows = []
+        self.progress = None
+        self.stats = doc.stats
+
+    def parse(self):
+        """ Parse the whole sheet and produce a row_event() for each row """
+        for row in self.iter_rows():
+            self.document.row_event(row)
+
+    def iter_rows(self):
+        """
+        Generator yielding the rows of the sheet as soon as they are parsed.
+        The sheet is fed to the parser in chunks, so a caller that stops
+        iterating early doesn't pay for the rest of the sheet.
+        """
+        fh = self.archive.sheet(self.sheet_id)
+        try:
+            if self.stats is None:
+                chunks = iter(lambda: fh.read(self.CHUNK_SIZE), '')
+            else:
+                chunks = self.stats.timed_chunks(fh.read, self.CHUNK_SIZE)
+            if self.document.progress_handler is not None:
+                info = self.archive.sheet_info(self.sheet_id)
+                self.progress = Progress(info.file_size, info.compress_size)
+                chunks = self.progress_chunks(chunks)
+            rows = self.parse_chunks(chunks)
+            if self.stats is not None:
+                rows = self.stats.timed_rows(rows)
+            for row in rows:
+                yield row
+            if self.progress is not None:
+                self.progress.finished = True
+                self.report_progress(time.time())
+        finally:
+            fh.close()
+
+    def progress_chunks(self, chunks):
+        """
+        Pass the chunks through, counting their bytes, and report the
+        progress at most once per progress interval of the document.
+        """
+        progress = self.progress
+        interval = self.document.progress_interval
+        next_report = progress.started + interval
+        for chunk in chunks:
+            if not progress.bytes:
+                progress.parse_dimension(chunk)
+            progress.bytes += len(chunk)
+            now = time.time()
+            if now >= next_report:
+                self.report_progress(now)
+                next_report = now + interval
+            yield chunk
+
+    def report_progress(self, now):
+        """ Pass the progress to the progress handler of the document """
+        progress = self.progress
+        progress.rows = self.row_count
+        progress.elapsed = now - progress.started
+        self.document.progress_handler(progress)
+
+    def parse_chunks(self, chunks, shared_strings=None):
+        """
+        Feed the chunks of sheet XML to the parser and yield finished rows.
+        The shared strings of the sheet are loaded unless given.
+        """
+        self.prepare(shared_strings)
+        try:
+            for row in self.expat_rows(chunks):
+                yield row
+        finally:
+            del self.shared_strings
 
-        self.shared_strings = self.document.shared_strings()
+    def prepare(self, shared_strings=None):
+        """ Load the shared strings and styles used while parsing """
+        if shared_strings is None:
+            shared_strings = self.document.sheet_shared_strings(self.sheet_id)
+        self.shared_strings = shared_strings
         self.styles = self.document.styles()
+        converters = self.styles.converters
+        if self.raw_dates or self.raw_numbers:
+            converters = self.styles.select_converters(self.raw_dates,
+                                                       self.raw_numbers)
+        # index the converters by the raw style attribute to avoid int()
+        self.converters = dict((unicode(i), c)
+                               for i, c in enumerate(converters))
+        self.converters[None] = converters[0]
+        # the style and its python type by raw style attribute, for ROW_DICT
+        styles = self.styles
+        self.style_types = dict(
+            (unicode(i), (styles.cell_style(i), t))
+            for i, t in enumerate(styles.cell_types))
+        self.style_types[None] = (styles.cell_style(None),
+                                  styles.cell_types[0])
+        if self.stats is not None:
+            self.instrument(self.stats)
+        # lazy cells look up their shared string after the sheet is parsed
+        strings = self.shared_strings
+        self.shared_string = lambda data: strings[int(data, 10)]
 
-        fh = archive.sheet(sheet_id)
-        parser.ParseFile(fh)
-        fh.close()
+    def instrument(self, stats):
+        """ Wrap the cell conversion steps to collect the stats """
+        if self.row_mode == self.ROW_LAZY:
+            # the values are converted later, when they are used
+            stats.lazy = True
+            self.lazy_cell = stats.counted('cells', self.lazy_cell)
+            self.empty_cell = stats.counted('fillers', self.empty_cell)
+            return
+        self.shared_strings = TimedLookup(self.shared_strings, stats,
+                                          'shared_strings')
+        dates = (datetime.datetime, datetime.date, datetime.time)
+        timers = dict((unicode(i), 'dates' if t in dates else 'convert')
+                      for i, t in enumerate(self.styles.cell_types))
+        timers[None] = timers[u'0']
+        self.converters = dict((k, stats.timed(timers[k], c))
+                               for k, c in self.converters.iteritems())
+        self.cell_value = stats.counted('cells', self.cell_value)
+        self.style_types = TimedLookup(self.style_types, stats, 'styles')
+        self.empty_cell = stats.counted('fillers', self.empty_cell)
 
-        del self.shared_strings
+    def expat_rows(self, chunks):
+        """ Parse the chunks with expat and yield finished rows """
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._char_data
 
-    def parse_rel(self, cell):
-        """ Convert numeric reference (A1, AD23) into numeric tuple (column, row) """
-        column, row = self.rel_re.match(cell[self.REF]).groups()
+        rows = self.finished_rows
+        for chunk in chunks:
+            parser.Parse(chunk, False)
+            if rows:
+                for row in rows:
+                    yield row
+                del rows[:]
+        parser.Parse('', True)
+        for row in rows:
+            yield row
+        del rows[:]
 
+    @staticmethod
+    def column_number(letters):
+        """ Convert column letters (A, AD) into the column number """
         v = 0
-        for i, ch in enumerate(column):
-            s = len(column) - i - 1
+        for i, ch in enumerate(letters):
+            s = len(letters) - i - 1
             v += (ord(ch) - ord('A') + 1) * (26**s)
+        return v
 
-        cell[self.REF] = (v, row)
+    def empty_cell(self, column, row, index):
+        """ Return a generated empty cell at position index of the row """
+        mode = self.row_mode
+        if mode == self.ROW_VALUES:
+            return u''
+        elif mode == self.ROW_CELLS:
+            return Cell(u'', column, None)
+        elif mode == self.ROW_LAZY:
+            return LazyCell(None, column, None, None)
+        return {
+            self.GENERATED_CELL: True,
+            self.STYLE_IDX: None,
+            self.TYPE: None,
+            self.REF: (column, row),
+            self.COLUMN: index,
+            self.VALUE: u'',
+            self.FMT: unicode,
+        }
+
+    def add_omitted_cells(self, column, row):
+        """ Fill the current row with empty cells up to the column """
+        current_column = len(self.current_row) + 1
         # savety check to detect omitted cells what we currently don't support
-        if cell[self.COLUMN] > v:
+        if current_column > column:
             raise Exception(
                 "Detected smaller index than current cell, something is wrong! (row %s): %s <> %s" % (
-                    row, v, cell[self.COLUMN]
+                    row, column, current_column
                 ))
-        # add omitted cells
-        for i in xrange(cell[self.COLUMN], v):
-            self.current_row.append({
-                self.GENERATED_CELL: True,
-                self.STYLE_IDX: None,
-                self.TYPE: None,
-                self.REF: (i, row),
-                self.COLUMN: i,
-                self.VALUE: u'',
-                self.FMT: unicode,
-            })
+        for i in xrange(current_column, column):
+            self.current_row.append(self.empty_cell(i, row, i))
+
+    def cell_value(self, cell_type, data, convert):
+        """ Convert the raw cell content with the style converter function """
+        if data is None:
+            return u''
+        elif cell_type == self.TYPE_SHARED_STRING:
+            return self.shared_strings[int(data, 10)]
+        elif cell_type in self.TEXT_TYPES:
+            return data
+        return convert(data)
+
+    def lazy_cell(self, column, style_idx, cell_type, data):
+        """ Return a cell converting the raw cell content on access """
+        if data is None or cell_type in self.TEXT_TYPES:
+            convert = None
+        elif cell_type == self.TYPE_SHARED_STRING:
+            convert = self.shared_string
+        else:
+            convert = self.converters[style_idx]
+        return LazyCell(data, column, style_idx, cell_type, convert)
+
+    def add_cell(self, column, row, style_idx, cell_type, data):
+        """ Convert the raw cell content and add the cell to the current row """
+        selection = self.selection
+        if selection is None:
+            position = len(self.current_row)
+            if position + 1 != column:
+                self.add_omitted_cells(column, row)
+                position = len(self.current_row)
+        else:
+            position = selection.get(column)
+            if position is None:
+                return
+        mode = self.row_mode
+        if mode == self.ROW_LAZY:
+            cell = self.lazy_cell(column, style_idx, cell_type, data)
+        elif mode == self.ROW_VALUES:
+            cell = self.cell_value(cell_type, data, self.converters[style_idx])
+        elif mode == self.ROW_CELLS:
+            cell = Cell(self.cell_value(cell_type, data,
+                                        self.converters[style_idx]),
+                        column, style_idx)
+        else:
+            v = self.cell_value(cell_type, data, self.converters[style_idx])
+            style, cellType = self.style_types[style_idx]
+            cell = {
+                self.STYLE_IDX: style_idx,
+                self.TYPE: cell_type,
+                self.REF: (column, row),
+                self.COLUMN: position + 1,
+                self.VALUE: v,
+                self.STYLE: style,
+                self.FMT: cellType,
+            }
+        if selection is None:
+            self.current_row.append(cell)
+        else:
+            self.current_row[position] = cell
+
+    def start_row(self):
+        """ Start a new current row """
+        if self.selection is None:
+            self.current_row = []
+        else:
+            self.current_row = [None] * len(self.selected)
+        self.row_ref = None
+
+    def end_row(self):
+        """ Finish the current row """
+        self.row_count += 1
+        row = self.current_row
+        if self.selection is not None:
+            for i, cell in enumerate(row):
+                if cell is None:
+                    row[i] = self.empty_cell(self.selected[i], self.row_ref,
+                                             i + 1)
+        if self.row_mode == self.ROW_VALUES:
+            self.finished_rows.append(tuple(row))
+        else:
+            self.finished_rows.append(row)
+        self.current_row = None
 
     def _start_element(self, name, attrs):
         #print "start element:", name, attrs
         if name == 'sheetData':
             self.is_sheetdata = True
         elif self.is_sheetdata and name == 'row':
-            self.current_row = []
+            self.start_row()
         elif name == 'c':
-            self.cell = {
-                self.STYLE_IDX: attrs.get(u's'),
-                self.TYPE: attrs.get(u't'),
-                self.REF: attrs.get(u'r'),
-                self.COLUMN: len(self.current_row) + 1,
-            }
+            letters, row = self.rel_re.match(attrs[u'r']).groups()
+            column = self.column_numbers.get(letters)
+            if column is None:
+                column = self.column_numbers[letters] = \
+                    self.column_number(letters)
+            self.row_ref = row
+            if self.selection is None or column in self.selection:
+                self.cell = (column, row, attrs.get(u's'), attrs.get(u't'))
         elif name == 'v':
-            self.is_value = True
+            self.is_value = self.cell is not None
 
     def _end_element(self, name):
         #print "end element:", name
         if name == 'sheetData':
             self.is_sheetdata = False
         elif self.is_sheetdata and name == 'row':
-            self.row_count += 1
-            self.document.row_event(self.current_row)
-            self.current_row = None
+            self.end_row()
         elif name == 'c':
-            c = self.cell
-            self.parse_rel(c)
-            if c[self.TYPE] == self.TYPE_SHARED_STRING:
-                idx = int(self.data, 10)
-                c[self.VALUE] = self.shared_strings[idx]
-            else:
-                c[self.VALUE] = self.data
-            #fmt = self.styles.numberFormat(c[self.STYLE_IDX])
-            #print "cell format is:", str(fmt['numFmt']), c[self.COLUMN], c[self.VALUE]
-            c[self.STYLE] = self.styles.cell_style(c[self.STYLE_IDX])
-            c[self.FMT] = cellType = self.styles.cell_type_from_style(c[self.STYLE])
-            v = c[self.VALUE]
-            if (v is not None) and (c[self.FMT] in (datetime.datetime,
-                                                    datetime.date,
-                                                    datetime.time)):
-                try:
-                    d = xldate.xldate_as_tuple(float(v), 0)
-                    c[self.VALUE] = cellType(*d)
-                except (xldate.XLDateAmbiguous, ValueError), e:
-                    if v == 1.0:
-                        print "value 1.0 for date:", c
-                        c[self.VALUE] = ''
-                    else:
-                        print "Invalid date, assume text or number content:", c[self.VALUE]
-                        if re.match(r'^\d+$', v):
-                            c[self.TYPE] = cellType = int
-                        elif re.match(r'^\d+\.\d+$', v):
-                            c[self.TYPE] = cellType = float
-                        else:
-                            c[self.TYPE] = cellType = unicode
-                        c[self.VALUE] = cellType(v)
-            else:
-                if v is None:
-                    c[self.VALUE] = ''
-                elif not cellType is unicode:
-                    try:
-                        c[self.VALUE] = cellType(v)
-                    except TypeError, e:
-                        print repr(c)
-                        print str(e), "value:", repr(v)
-                        raise e
-            self.current_row.append(c)
+            if self.cell is not None:
+                column, row, style_idx, cell_type = self.cell
+                self.add_cell(column, row, style_idx, cell_type, self.data)
             self.data = None
             self.cell = None
         elif name == 'v':
@@ -383,20 +2116,95 @@ class Document(object):
     """
     Represent a whole XLSX document and provide a high level interface to
     its parts.
+
+    Threads may share a document and read its sheets at the same time, the
+    parts used by all sheets are loaded once.
     """
-    def __init__(self, filename=None):
+    ENGINE_EXPAT = 'expat'
+    ENGINE_SCANNER = 'scanner'
+
+    STRINGS_LIST = 'list'
+    STRINGS_MAPPED = 'mapped'
+    STRINGS_SPARSE = 'sparse'
+    STRINGS_COMPACT = 'compact'
+
+    def __init__(self, filename=None, row_mode=Sheet.ROW_DICT,
+                 shared_strings_mode=STRINGS_LIST, cache_dir=None,
+                 read_ahead=False, engine=ENGINE_EXPAT,
+                 buffer_size=ReadAheadReader.BUFFER_SIZE,
+                 queue_depth=ReadAheadReader.QUEUE_DEPTH, raw_numbers=False):
+        """
+        The shared_strings_mode selects how the shared strings are stored:
+        STRINGS_LIST parses all of them into a list, STRINGS_MAPPED reads
+        them from a memory mapped sidecar file (written next to the document
+        or into cache_dir), STRINGS_COMPACT keeps them encoded in a single
+        buffer and STRINGS_SPARSE loads for each sheet only the strings it
+        references.
+
+        With read_ahead the sheets are inflated in a background thread, see
+        DocumentArchive for buffer_size and queue_depth.
+
+        The engine selects the sheet parser: ENGINE_EXPAT or ENGINE_SCANNER,
+        the faster byte scanner of the fastxlsx.scanner module.
+
+        With raw_numbers the cells with a number format hold the text of
+        their value as written in the sheet instead of an int or float.
+        """
+        self.row_mode = row_mode
+        self.shared_strings_mode = shared_strings_mode
+        self.cache_dir = cache_dir
+        self.read_ahead = read_ahead
+        self.engine = engine
+        self.buffer_size = buffer_size
+        self.queue_depth = queue_depth
+        self.raw_numbers = raw_numbers
         self.__archive = None
         self.__shared_strings = None
         self.__styles = None
         self.__workbook = None
         self.__sheets = {}
+        self.__sheet_locks = {}
+        self.__row_indexes = {}
+        # guards the parts loaded on first use, for threads sharing the
+        # document
+        self.__lock = threading.RLock()
         self.__row_event_handlers = []
+        self.progress_handler = None
+        self.progress_interval = Progress.INTERVAL
+        self.stats = None
         if filename is not None:
             self.open(filename)
 
     def open(self, filename):
         """ Provide filename of XLSX document to open """
-        self.__archive = DocumentArchive(filename)
+        self.__archive = DocumentArchive(filename, self.read_ahead,
+                                         self.buffer_size, self.queue_depth)
+
+    def open_stream(self, fh, spool_size=StreamArchive.SPOOL_SIZE):
+        """
+        Provide the XLSX document as a file like object to read from in
+        order, like a pipe or a socket, see StreamArchive. The row indexes
+        and the STRINGS_MAPPED and STRINGS_SPARSE modes need a document
+        file instead.
+        """
+        if self.shared_strings_mode in (self.STRINGS_MAPPED,
+                                        self.STRINGS_SPARSE):
+            raise ValueError("Shared strings mode %s can't read a stream" %
+                             self.shared_strings_mode)
+        self.__archive = StreamArchive(fh, spool_size)
+
+    def open_buffer(self, buffer):
+        """
+        Provide the XLSX document as a buffer, a string or a mmap. Row
+        indexes aren't stored as sidecar files then, and STRINGS_MAPPED
+        needs a document file instead.
+        """
+        if self.shared_strings_mode == self.STRINGS_MAPPED:
+            raise ValueError("Shared strings mode %s can't read a buffer" %
+                             self.shared_strings_mode)
+        self.__archive = DocumentArchive(None, self.read_ahead,
+                                         self.buffer_size, self.queue_depth,
+                                         buffer)
 
     def archive(self):
         if self.__archive is None:
@@ -405,31 +2213,194 @@ class Document(object):
 
     def shared_strings(self):
         if self.__shared_strings is None:
-            self.__shared_strings = SharedStrings(self.archive())
+            with self.__lock:
+                if self.__shared_strings is None:
+                    self.__shared_strings = self.load_shared_strings()
         return self.__shared_strings
 
+    def load_shared_strings(self):
+        archive = self.archive()
+        if not archive.has_shared_strings():
+            return []
+        elif self.shared_strings_mode == self.STRINGS_MAPPED:
+            return MappedSharedStrings.open(archive, self.cache_dir)
+        elif self.shared_strings_mode == self.STRINGS_COMPACT:
+            return CompactSharedStrings(archive)
+        return SharedStrings(archive)
+
+    def sheet_shared_strings(self, sheet_id):
+        """
+        Return the shared strings for the sheet. In STRINGS_SPARSE mode the
+        sheet is scanned first and only the referenced strings are loaded.
+        """
+        if self.shared_strings_mode != self.STRINGS_SPARSE:
+            return self.shared_strings()
+        archive = self.archive()
+        wanted = SheetStringReferences(archive, sheet_id)
+        if not archive.has_shared_strings():
+            wanted = None
+        return SparseSharedStrings(archive, wanted)
+
     def styles(self):
         if self.__styles is None:
-            self.__styles = Styles(self.archive())
+            with self.__lock:
+                if self.__styles is None:
+                    self.__styles = Styles(self.archive(),
+                                           self.workbook().datemode)
         return self.__styles
 
     def workbook(self):
         if self.__workbook is None:
-            self.__workbook = Workbook(self.archive())
+            with self.__lock:
+                if self.__workbook is None:
+                    self.__workbook = Workbook(self.archive())
         return self.__workbook
 
     def sheet_names(self):
         """ Return the name of the sheets in workbook """
         return self.workbook().names()
 
-    def sheet(self, name):
-        """ Return a sheet object from the sheet with the name """
-        if not self.__sheets.has_key(name):
-            sheet_id = self.workbook().sheet_id(name)
-            if not sheet_id:
-                return None
-            self.__sheets[name] = Sheet(self, self.archive(), sheet_id)
-        return self.__sheets[name]
+    def sheet(self, name, columns=None):
+        """
+        Return a sheet object from the sheet with the name. With columns
+        only the selected columns are passed to the row event handlers, see
+        select_columns().
+        """
+        if columns is not None:
+            columns = tuple(self.select_columns(name, columns))
+        key = (name, columns)
+        with self.__lock:
+            # other sheets are parsed at the same time, the same one once
+            lock = self.__sheet_locks.setdefault(key, threading.Lock())
+        with lock:
+            if not self.__sheets.has_key(key):
+                sheet_id = self.workbook().sheet_id(name)
+                if not sheet_id:
+                    return None
+                sheet = self.create_sheet(sheet_id, columns=columns)
+                sheet.parse()
+                self.__sheets[key] = sheet
+        return self.__sheets[key]
+
+    def iter_rows(self, name, row_mode=None, columns=None):
+        """
+        Return a generator over the rows of the sheet with the name. Rows are
+        parsed on demand and not passed to the row event handlers. The
+        row_mode defaults to the one of the document. With columns the rows
+        hold only the selected columns, see select_columns().
+        """
+        if columns is not None:
+            columns = self.select_columns(name, columns)
+        sheet = self.create_sheet(self.workbook().sheet_id(name), row_mode,
+                                  columns)
+        return sheet.iter_rows()
+
+    def row_index(self, name, interval=RowIndex.INTERVAL):
+        """
+        Return the RowIndex of the sheet with the name, built on first use
+        and stored next to the document or in cache_dir.
+        """
+        sheet_id = self.workbook().sheet_id(name)
+        with self.__lock:
+            index = self.__row_indexes.get(sheet_id)
+            if index is None or index.interval != interval:
+                index = RowIndex.open(self.archive(), sheet_id,
+                                      self.cache_dir, interval)
+                self.__row_indexes[sheet_id] = index
+        return index
+
+    def read_rows(self, name, start, stop, row_mode=None, columns=None):
+        """
+        Return the list of the rows start to stop (exclusive, counted from
+        0 like the rows of iter_rows()) of the sheet with the name. The
+        parser starts at the indexed row before start, see row_index().
+        """
+        index = self.row_index(name)
+        found = index.lookup(start)
+        if found is None or stop <= start:
+            return []
+        row, offset = found
+        if columns is not None:
+            columns = self.select_columns(name, columns)
+        sheet_id = self.workbook().sheet_id(name)
+        sheet = self.create_sheet(sheet_id, row_mode, columns)
+        fh = self.archive().sheet_checkpoint_reader(sheet_id,
+                                                    index.checkpoints, offset)
+        try:
+            rows = sheet.parse_chunks(resume_sheet_chunks(fh,
+                                                          sheet.CHUNK_SIZE))
+            try:
+                return list(itertools.islice(rows, start - row, stop - row))
+            finally:
+                rows.close()
+        finally:
+            fh.close()
+
+    def threaded_rows(self, name, row_mode=None, columns=None,
+                      batch_size=ThreadedRows.BATCH_SIZE,
+                      queue_depth=ThreadedRows.QUEUE_DEPTH):
+        """
+        Return a ThreadedRows iterator over the rows of the sheet with the
+        name, parsed in a background thread like iter_rows() would. A
+        consumer like an event loop can poll the batches of rows without
+        blocking and cancel the parsing.
+        """
+        return ThreadedRows(self.iter_rows(name, row_mode, columns),
+                            batch_size, queue_depth)
+
+    def select_columns(self, name, columns):
+        """
+        Return the column numbers (1 is A) of the columns of the sheet with
+        the name. The columns are given by number, by letters or by the
+        name in the header row, which takes precedence over letters.
+        """
+        header = None
+        numbers = []
+        for column in columns:
+            if isinstance(column, (int, long)):
+                if column < 1:
+                    raise ValueError("Invalid column number: %d" % column)
+                numbers.append(column)
+                continue
+            if header is None:
+                header = []
+                for row in self.iter_rows(name, Sheet.ROW_VALUES):
+                    header = list(row)
+                    break
+            if column in header:
+                numbers.append(header.index(column) + 1)
+            elif Sheet.letters_re.match(column):
+                numbers.append(Sheet.column_number(column))
+            else:
+                raise ValueError("No such column in sheet %s: %s" % (
+                    name, column))
+        return numbers
+
+    def iter_batches(self, name, batch_size=10000, header=True,
+                     columns=None):
+        """
+        Return a generator over the rows of the sheet with the name in
+        batches of batch_size rows, each stored column by column in NumPy
+        arrays. See fastxlsx.columnar, this needs NumPy.
+        """
+        from fastxlsx import columnar
+        return columnar.iter_batches(self, name, batch_size, header, columns)
+
+    def create_sheet(self, sheet_id, row_mode=None, columns=None):
+        """
+        Return an unparsed sheet object of the selected engine, with columns
+        limited to the given column numbers.
+        """
+        if row_mode is None:
+            row_mode = self.row_mode
+        if self.engine == self.ENGINE_SCANNER:
+            from fastxlsx import scanner
+            sheet = scanner.ScannerSheet(self, self.archive(), sheet_id,
+                                         row_mode, columns)
+        else:
+            sheet = Sheet(self, self.archive(), sheet_id, row_mode, columns)
+        sheet.raw_numbers = self.raw_numbers
+        return sheet
 
     def add_row_event_handler(self, handler):
         """
@@ -445,7 +2416,30 @@ class Document(object):
         """
         self.__row_event_handlers.remove(handler)
 
+    def set_progress_handler(self, handler, interval=Progress.INTERVAL):
+        """
+        Set the function called with a Progress object while a sheet is
+        read, every interval seconds and when the sheet is done. Use None
+        to remove it.
+        """
+        self.progress_handler = handler
+        self.progress_interval = interval
+
+    def enable_stats(self):
+        """
+        Collect the Stats of the sheets read from now on and return them.
+        The row event handlers are timed too.
+        """
+        self.stats = Stats()
+        return self.stats
+
     def row_event(self, row):
+        if self.stats is not None:
+            start = time.time()
+            for handler in self.__row_event_handlers:
+                handler(row)
+            self.stats.times['handlers'] += time.time() - start
+            return
         for handler in self.__row_event_handlers:
             handler(row)
 
@@ -469,28 +2463,32 @@ def main():
         raise Exception("arguments XLSX file or workbook missing")
 
     doc = Document()
-    storage = FirstNRowStorage(2)
-    doc.add_row_event_handler(storage)
     doc.open(sys.argv[1])
+    stats = doc.enable_stats()
     print "Read %d shared strings" % len(doc.shared_strings())
     print "Workbook contains sheets:", doc.sheet_names()
     sheetname = sys.argv[2]
     print "Sheet ID for '%s':" % sheetname, doc.workbook().sheet_id(sheetname)
-    sheet = doc.sheet(sheetname)
-    print "Read %d rows" % len(storage.rows)
+    storage = FirstNRowStorage(2)
+    doc.add_row_event_handler(storage)
+    doc.sheet(sheetname)
+    rows = storage.rows
+    print "Read %d rows" % stats.counts['rows']
     print "row 0:"
     def debug_row(row):
         for c in row:
+            # generated cells have no style
+            style = c.get(Sheet.STYLE)
             print "    %s: %-16s: %s" % (
                 c[Sheet.REF],
-                doc.styles().cell_format_from_style(c[Sheet.STYLE]),
+                style and doc.styles().cell_format_from_style(style),
                 c[Sheet.VALUE]
             )
-    debug_row(storage.rows[0])
+    debug_row(rows[0])
     print "row 1:"
-    debug_row(storage.rows[1])
+    debug_row(rows[1])
+    print "Stats:"
+    print stats
 
 if __name__ == '__main__':
-    import cProfile
-    cProfile.run('main()', 'profile')
-    #main()
+    main()
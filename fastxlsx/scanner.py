@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Sheet parsing engine scanning the worksheet bytes with compiled regular
+expressions instead of calling back into python for every XML event.
+
+The scanner only understands the plain sheetData grammar written by the
+usual producers: <row> elements with <c r=".." s=".." t=".."> cells holding
+an optional formula and a <v> value. Every row that doesn't match that
+grammar completely (inline strings, CDATA, comments, other attribute
+order, ...) is handed to the expat parser of the base class instead.
+"""
+
+import re
+import itertools
+from fastxlsx import reader
+
+ROW_RE = re.compile(r'\s*<row\b[^>]*?(?:/>|>(.*?)</row>)', re.S)
+CELL_RE = re.compile(
+    r'\s*<c r="([A-Z]+)(\d+)"(?: s="(\d+)")?(?: t="(\w+)")?'
+    r'(?: (?![rst]=)[a-z]+="[^"]*")*\s*'
+    r'(?:/>|>(?:<f\b[^>]*?(?:/>|>[^<]*</f>))?(?:<v>([^<]*)</v>)?</c>)')
+ENTITY_RE = re.compile(r'&(#x[0-9a-fA-F]+|#\d+|amp|lt|gt|quot|apos);')
+ENTITIES = {'amp': u'&', 'lt': u'<', 'gt': u'>', 'quot': u'"', 'apos': u"'"}
+
+def _entity(m):
+    name = m.group(1)
+    if name[:2] == '#x':
+        return unichr(int(name[2:], 16))
+    elif name[:1] == '#':
+        return unichr(int(name[1:]))
+    return ENTITIES[name]
+
+def unescape(data):
+    """ Decode the UTF-8 text of a value and resolve its entities """
+    data = data.decode('UTF-8')
+    if '&' in data:
+        return ENTITY_RE.sub(_entity, data)
+    return data
+
+class ScannerSheet(reader.Sheet):
+    """
+    Sheet parsed by scanning the bytes of the sheetData element, falling
+    back to expat for rows the scanner doesn't understand.
+    """
+    def parse_chunks(self, chunks, shared_strings=None):
+        self.prepare(shared_strings)
+        try:
+            for piece in reader.split_sheet_chunks(chunks):
+                for row in self.scan_rows(piece):
+                    yield row
+        finally:
+            del self.shared_strings
+
+    def scan_rows(self, piece):
+        """ Yield the rows of a piece of sheetData cut at row boundaries """
+        rows = self.finished_rows
+        pos = 0
+        end = len(piece)
+        match = ROW_RE.match
+        while pos < end:
+            m = match(piece, pos)
+            if m is None:
+                if piece[pos:].strip():
+                    # not a row, let expat deal with the rest of the piece
+                    for row in self.expat_piece(piece[pos:]):
+                        yield row
+                break
+            pos = m.end()
+            if not self.scan_row(m.group(1)):
+                for row in self.expat_piece(m.group(0)):
+                    yield row
+                continue
+            for row in rows:
+                yield row
+            del rows[:]
+
+    def scan_row(self, content):
+        """
+        Add the cells of the row content and finish the row. Return False
+        without touching the row if the content doesn't fit the grammar.
+        """
+        cells = []
+        if content:
+            pos = 0
+            end = len(content)
+            match = CELL_RE.match
+            while pos < end:
+                m = match(content, pos)
+                if m is None:
+                    if content[pos:].strip():
+                        return False
+                    break
+                cells.append(m.groups())
+                pos = m.end()
+
+        self.start_row()
+        columns = self.column_numbers
+        selection = self.selection
+        for letters, row, style_idx, cell_type, data in cells:
+            column = columns.get(letters)
+            if column is None:
+                column = columns[letters] = self.column_number(letters)
+            self.row_ref = row
+            if selection is not None and column not in selection:
+                continue
+            # an empty value element is no value, as with expat
+            data = unescape(data) if data else None
+            self.add_cell(column, row, style_idx, cell_type, data)
+        self.end_row()
+        return True
+
+    def expat_piece(self, piece):
+        """ Parse a piece of sheetData with expat """
+        return self.expat_rows([reader.SHEETDATA_START, piece,
+                                reader.SHEETDATA_END])
+
+def compare_engines(doc, name, row_mode=reader.Sheet.ROW_VALUES):
+    """
+    Parse the sheet with the name with the expat and the scanner engine and
+    return the index of the first row that differs, or None if they agree.
+    Cell objects are compared by their value, column and style index.
+    """
+    archive = doc.archive()
+    sheet_id = doc.workbook().sheet_id(name)
+    expat = reader.Sheet(doc, archive, sheet_id, row_mode).iter_rows()
+    scanner = ScannerSheet(doc, archive, sheet_id, row_mode).iter_rows()
+    objects = row_mode in (reader.Sheet.ROW_CELLS, reader.Sheet.ROW_LAZY)
+    for i, (a, b) in enumerate(itertools.izip_longest(expat, scanner)):
+        if objects and a is not None and b is not None:
+            a = [(c.value, c.column, c.style_idx) for c in a]
+            b = [(c.value, c.column, c.style_idx) for c in b]
+        if a != b:
+            return i
+    return None
@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2011 Andreas Stricker <andy@knitter.ch>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import sqlite3
+import datetime
+import fastxlsx
+
+class Loader(object):
+    """
+    Load XLSX rows into a SQLite table.
+    The table is created from the first row, which holds the column names.
+    The rows are expected as value tuples, so open the document in ROW_MODE.
+    """
+    ROW_MODE = fastxlsx.reader.Sheet.ROW_VALUES
+
+    # settings for a fast bulk load, trading durability for speed
+    PRAGMAS = (
+        ('synchronous', 'OFF'),
+        ('journal_mode', 'MEMORY'),
+        ('temp_store', 'MEMORY'),
+        ('cache_size', '-65536'),
+    )
+    IF_EXISTS_FAIL = 'fail'
+    IF_EXISTS_REPLACE = 'replace'
+    IF_EXISTS_APPEND = 'append'
+
+    def __init__(self, database, table, if_exists=IF_EXISTS_FAIL,
+                 batch_size=10000, transaction_size=1000000,
+                 pragmas=PRAGMAS):
+        """
+        The database is a filename or a sqlite3 connection. Rows are
+        inserted with executemany in batches of batch_size rows and
+        committed every transaction_size rows.
+        """
+        if isinstance(database, basestring):
+            self.connection = sqlite3.connect(database)
+        else:
+            self.connection = database
+        for name, value in pragmas:
+            self.connection.execute('PRAGMA %s = %s' % (name, value))
+        self.table = table
+        self.if_exists = if_exists
+        self.batch_size = batch_size
+        self.transaction_size = transaction_size
+        self.insert = None
+        self.batch = []
+        self.columns = 0
+        self.rows = 0
+
+    def __call__(self, row):
+        if self.insert is None:
+            self.create_table(row)
+            return
+        if len(row) > self.columns:
+            raise ValueError("Row %d has %d columns, the header only %d" % (
+                self.rows + 2, len(row), self.columns))
+        record = [self.adapt(v) for v in row]
+        record.extend([None] * (self.columns - len(record)))
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def create_table(self, header):
+        """ Create the table with the column names of the header row """
+        names = []
+        seen = set()
+        for i, name in enumerate(header):
+            name = unicode(name).strip() or u'column%d' % (i + 1)
+            unique = name
+            n = 1
+            # SQLite column names are case insensitive
+            while unique.lower() in seen:
+                n += 1
+                unique = u'%s_%d' % (name, n)
+            seen.add(unique.lower())
+            names.append(unique)
+        self.columns = len(names)
+
+        table = self.quote(self.table)
+        columns = ', '.join(self.quote(n) for n in names)
+        if self.if_exists == self.IF_EXISTS_REPLACE:
+            self.connection.execute('DROP TABLE IF EXISTS %s' % table)
+        exists = ''
+        if self.if_exists == self.IF_EXISTS_APPEND:
+            exists = 'IF NOT EXISTS '
+        self.connection.execute('CREATE TABLE %s%s (%s)' % (
+            exists, table, columns))
+        # name the columns, an existing table may order them differently
+        self.insert = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            table, columns, ', '.join(['?'] * self.columns))
+
+    @staticmethod
+    def quote(name):
+        return u'"%s"' % name.replace(u'"', u'""')
+
+    @staticmethod
+    def adapt(v):
+        """ Return a value SQLite can store, empty cells are NULL """
+        if v == '':
+            return None
+        elif isinstance(v, (datetime.date, datetime.time)):
+            return v.isoformat()
+        elif isinstance(v, datetime.timedelta):
+            return v.total_seconds()
+        return v
+
+    def flush(self):
+        """ Insert the pending rows, commit after transaction_size rows """
+        if not self.batch:
+            return
+        before = self.rows
+        self.connection.executemany(self.insert, self.batch)
+        self.rows += len(self.batch)
+        self.batch = []
+        if before // self.transaction_size != self.rows // self.transaction_size:
+            self.connection.commit()
+
+    def close(self):
+        """ Insert the pending rows, commit and close the connection """
+        if self.connection:
+            self.flush()
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None